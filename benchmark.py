@@ -0,0 +1,232 @@
+import argparse
+import datetime
+import fnmatch
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import create_engine, select, func
+
+import metrics
+import queries
+import streaming
+from delta_loader import IncrementalLoader
+from frame_schema import PROJECTED_COLUMNS, compact_frame, read_window
+from indexes import DASHBOARD_INDEXES
+from mock_db import Base, Email, generate_mock_data_fast
+
+# --- PANEL BENCHMARK OVER GENERATED SQLITE DATASETS ---
+# Seeds one SQLite file per scale with the fast mock generator (reused on
+# later runs), then times load_data and every panel over the full data span,
+# both as the dashboard's SQL queries and as the in-memory computation on
+# the loaded frame. Needs no MySQL server.
+
+DEFAULT_SCALES = [10_000, 1_000_000, 10_000_000]
+DEFAULT_DATA_DIR = "bench_data"
+DEFAULT_OUTPUT = "bench_results.json"
+
+emails = Email.__table__
+
+# Benchmark step -> dashboard panels it produces
+PANEL_GROUPS = {
+    'metrics': ['metrics'],
+    'daily': ['daily'],
+    'sentiment': ['sentiment'],
+    'lead_rates': ['title_lead_rate', 'agent_lead_rate'],
+    'weekday_hour': ['weekday', 'hourly'],
+    'reply_time_hist': ['reply_time_hist'],
+    'top_companies': ['top_companies'],
+    'funnels': ['city_funnel', 'industry_funnel'],
+}
+
+
+# --- DATASETS ---
+
+def ensure_dataset(data_dir, rows, days=90, seed=42, batch_size=50_000):
+    """Return an engine on a SQLite file holding exactly `rows` mock emails, generating it if needed."""
+    os.makedirs(data_dir, exist_ok=True)
+    engine = create_engine(f"sqlite:///{os.path.join(data_dir, f'emails_{rows}.db')}")
+    if sqlalchemy.inspect(engine).has_table(emails.name):
+        with engine.connect() as conn:
+            if conn.execute(select(func.count()).select_from(emails)).scalar() == rows:
+                return engine
+    print(f"Generating {rows:,} rows...")
+    Base.metadata.drop_all(bind=engine, tables=[emails])
+    Base.metadata.create_all(bind=engine, tables=[emails])
+    # Same as mock_db --fast: secondary indexes are built once after the load
+    for index in DASHBOARD_INDEXES:
+        index.drop(bind=engine)
+    generate_mock_data_fast(engine, num_rows=rows, days=days, seed=seed, batch_size=batch_size)
+    for index in DASHBOARD_INDEXES:
+        index.create(bind=engine)
+    return engine
+
+
+def data_window(engine):
+    """The dashboard window covering every generated row, by calendar day."""
+    with engine.connect() as conn:
+        first, last = conn.execute(select(func.min(emails.c.timestamp), func.max(emails.c.timestamp))).one()
+    first, last = pd.Timestamp(first).date(), pd.Timestamp(last).date()
+    return (datetime.datetime.combine(first, datetime.time.min),
+            datetime.datetime.combine(last, datetime.time.max))
+
+
+# --- MEASUREMENT ---
+
+def measure(fn, repeat=3, trace_memory=True):
+    """
+    Median and best wall time of `repeat` calls, plus the peak of memory
+    allocated during one extra traced call. tracemalloc sees Python objects
+    and numpy/pandas buffers, not SQLite's own page cache.
+    """
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    result = {'wall_s': statistics.median(samples), 'wall_min_s': min(samples), 'peak_mib': None}
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            result['peak_mib'] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def benchmark_steps(engine, start_dt, end_dt):
+    """Yield (step name, callable). Setup work shared by several steps happens between yields, untimed."""
+    def load_data():
+        with engine.connect() as conn:
+            return read_window(conn, start_dt, end_dt)
+
+    yield 'load_data', load_data
+    # A rerun with no new rows: the incremental loader only checks the id watermark and its gaps
+    loader = IncrementalLoader(engine, columns=PROJECTED_COLUMNS, convert=compact_frame)
+    loader.load(start_dt, end_dt)
+    yield 'load_data.incremental', lambda: loader.load(start_dt, end_dt)
+
+    frame = load_data()
+    yield 'frame.aggregate', lambda: metrics.aggregate(frame)
+    aggregates = metrics.aggregate(frame)
+    for group, panels in PANEL_GROUPS.items():
+        yield f'frame.{group}', lambda panels=panels: metrics.finish(aggregates, panels, window=(start_dt, end_dt))
+    yield 'frame.all', lambda: metrics.compute_panels(frame, window=(start_dt, end_dt))
+    del frame, aggregates
+
+    for group, panels in PANEL_GROUPS.items():
+        yield f'sql.{group}', lambda panels=panels: queries.load_panels(engine, start_dt, end_dt, panels)
+    yield 'sql.all', lambda: queries.load_panels(engine, start_dt, end_dt)
+    yield 'stream.all', lambda: streaming.stream_panels(engine, start_dt, end_dt)
+
+
+def run(scales, data_dir=DEFAULT_DATA_DIR, repeat=3, trace_memory=True, steps=None, days=90, seed=42):
+    results = []
+    for rows in scales:
+        engine = ensure_dataset(data_dir, rows, days=days, seed=seed)
+        start_dt, end_dt = data_window(engine)
+        print(f"\n===== {rows:,} rows ({start_dt.date()} .. {end_dt.date()}) =====")
+        print(f"{'step':<26}{'median ms':>12}{'best ms':>12}{'peak MiB':>12}")
+        for name, fn in benchmark_steps(engine, start_dt, end_dt):
+            if steps and not any(fnmatch.fnmatch(name, pattern) for pattern in steps):
+                continue
+            result = measure(fn, repeat=repeat, trace_memory=trace_memory)
+            results.append({'scale': rows, 'step': name, **result})
+            peak = f"{result['peak_mib']:.1f}" if result['peak_mib'] is not None else '-'
+            print(f"{name:<26}{result['wall_s'] * 1000:>12.2f}{result['wall_min_s'] * 1000:>12.2f}{peak:>12}")
+        engine.dispose()
+    return {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'sqlalchemy': sqlalchemy.__version__,
+            'repeat': repeat,
+            'days': days,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+# --- BASELINE COMPARISON ---
+
+def compare(baseline, current, threshold=0.2, min_delta_ms=5.0):
+    """
+    Print current vs baseline for every (scale, step) in both and return the
+    regressions: median wall time or peak memory more than `threshold` above
+    the baseline. Wall-time changes under min_delta_ms are treated as noise.
+    """
+    base = {(r['scale'], r['step']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'scale':>10}  {'step':<26}{'base ms':>11}{'now ms':>11}{'ratio':>8}{'base MiB':>10}{'now MiB':>10}")
+    for r in current['results']:
+        b = base.get((r['scale'], r['step']))
+        if b is None:
+            continue
+        ratio = r['wall_s'] / b['wall_s'] if b['wall_s'] else float('inf')
+        flags = []
+        if ratio > 1 + threshold and (r['wall_s'] - b['wall_s']) * 1000 >= min_delta_ms:
+            flags.append('time')
+        if r['peak_mib'] is not None and b['peak_mib'] and r['peak_mib'] > b['peak_mib'] * (1 + threshold):
+            flags.append('memory')
+        base_mib = f"{b['peak_mib']:.1f}" if b['peak_mib'] is not None else '-'
+        now_mib = f"{r['peak_mib']:.1f}" if r['peak_mib'] is not None else '-'
+        print(f"{r['scale']:>10}  {r['step']:<26}{b['wall_s'] * 1000:>11.2f}{r['wall_s'] * 1000:>11.2f}"
+              f"{ratio:>7.2f}x{base_mib:>10}{now_mib:>10}  {'REGRESSION: ' + '/'.join(flags) if flags else ''}")
+        if flags:
+            regressions.append({'scale': r['scale'], 'step': r['step'], 'kinds': flags, 'ratio': ratio})
+    print(f"\n{len(regressions)} regression(s) above {threshold:.0%}.")
+    return regressions
+
+
+def _read_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load_data and every dashboard panel on generated SQLite data.")
+    parser.add_argument("command", nargs="?", choices=["run", "compare"], default="run",
+                        help="run the benchmark, or compare an existing --output file with --baseline")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="dataset sizes in rows")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where the generated SQLite files are kept")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per step")
+    parser.add_argument("--steps", nargs="+", help="only run steps matching these patterns, e.g. 'sql.*' load_data")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run for peak memory")
+    parser.add_argument("--days", type=int, default=90, help="date span of generated data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="results file to write (run) or read (compare)")
+    parser.add_argument("--baseline", help="saved results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown/growth before flagging")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        if not args.baseline:
+            parser.error("compare needs --baseline")
+        current = _read_results(args.output)
+    else:
+        current = run(args.scales, data_dir=args.data_dir, repeat=args.repeat, trace_memory=not args.no_memory,
+                      steps=args.steps, days=args.days, seed=args.seed)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.baseline:
+        regressions = compare(_read_results(args.baseline), current, threshold=args.threshold)
+        raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
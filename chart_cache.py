@@ -0,0 +1,86 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+import altair as alt
+import pandas as pd
+
+# --- VEGA-LITE SPEC CACHE FOR THE DASHBOARD CHARTS ---
+# Building an Altair chart and serializing it with to_dict() costs more than
+# the aggregated frame it shows. Specs are cached per process, keyed on the
+# chart name, a fingerprint of the frame and whatever else the builder reads,
+# and the least recently used ones are dropped past max_entries. Cached specs
+# are theme-neutral: the theme goes on top as a small overlay at render time.
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def frame_fingerprint(df):
+    """Content hash of a (small, aggregated) frame: values, index, column names and dtypes."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+_ALTAIR_LOCK = threading.Lock()
+
+
+def chart_spec(chart):
+    """
+    Vega-Lite dict of an Altair chart as st.altair_chart would see it: no
+    default-theme view size and no row limit. Both are Altair globals, so
+    sessions serialize one at a time.
+    """
+    with _ALTAIR_LOCK, alt.theme.enable("none"), alt.data_transformers.disable_max_rows():
+        return chart.to_dict()
+
+
+def apply_overlay(spec, overlay):
+    """spec with overlay merged in (nested dicts merged, anything else replaced). spec is not modified."""
+    merged = dict(spec)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = apply_overlay(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+class ChartSpecCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key, build):
+        """The cached spec for key, or build() it (a Vega-Lite dict) and keep it. Do not modify the result."""
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self._specs.move_to_end(key)
+                self.hits += 1
+                return spec
+            self.misses += 1
+        # Built outside the lock; two sessions missing the same key at once both build it
+        spec = build()
+        with self._lock:
+            self._specs[key] = spec
+            self._specs.move_to_end(key)
+            while len(self._specs) > self.max_entries:
+                self._specs.popitem(last=False)
+                self.evictions += 1
+        return spec
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._specs), 'hit_rate': self.hits / lookups if lookups else None}
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
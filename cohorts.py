@@ -0,0 +1,307 @@
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+
+import pandas as pd
+from sqlalchemy import create_engine, select, update, func, bindparam
+
+import indexes
+import partitions
+import snapshot
+from delta_loader import IncrementalLoader
+from metrics import SECONDS_PER_DAY, funnel_frame
+from mock_db import Base, Email, DB_URL, existing_columns, generate_mock_data_fast
+from queries import count_if
+
+emails = Email.__table__
+
+BACKFILL_BATCH = 10_000
+
+# --- SEND COHORTS ---
+# A cohort is every email sent in one week (Monday start). Replies are joined
+# back to the email they answer through emails.reply_to_id, so a cohort's
+# reply and lead rates count every reply its sends ever got, whenever it
+# arrived, and never replies to emails sent outside the window. Only two
+# GROUP BYs leave the database: sends per (day, agent) and replies per
+# (send day, agent, whole days to reply).
+
+sent = emails.alias('sent')
+reply = emails.alias('reply')
+
+
+def query_cohort_counts(conn, start_dt, end_dt):
+    """Returns (sends: day, ai_agent, sent; replies: day, ai_agent, days_to_reply, replies, leads)."""
+    send_day = func.date(sent.c.timestamp).label('day')
+    in_window = sent.c.timestamp.between(start_dt, end_dt)
+    sends = pd.read_sql(
+        select(send_day, sent.c.ai_agent, func.count().label('sent'))
+        .where(in_window, sent.c.direction == 'sent')
+        .group_by(send_day, sent.c.ai_agent),
+        conn,
+    )
+    # Only replies carry reply_to_id, so the join needs no direction filter
+    days_to_reply = (reply.c.reply_time_delta_seconds // SECONDS_PER_DAY).label('days_to_reply')
+    replies = pd.read_sql(
+        select(
+            send_day, sent.c.ai_agent, days_to_reply,
+            func.count().label('replies'),
+            count_if(reply.c.reply_sentiment == 'positive').label('leads'),
+        )
+        .select_from(sent.join(reply, reply.c.reply_to_id == sent.c.id))
+        .where(in_window, sent.c.direction == 'sent', reply.c.reply_time_delta_seconds.is_not(None))
+        .group_by(send_day, sent.c.ai_agent, days_to_reply),
+        conn,
+    )
+    return sends, replies
+
+
+def _week(days):
+    days = pd.to_datetime(days)
+    return days - pd.to_timedelta(days.dt.weekday, unit='D')
+
+
+def cohort_matrix_frame(sends, replies, today=None):
+    """
+    Send week x days to reply, one row per cell: replies that arrived on that
+    day and the cohort's cumulative reply rate up to it. Cells the cohort
+    has not fully lived through yet (its last send day plus the reply delay
+    is not before today) are left out.
+    """
+    columns = ['Send Week', 'Days to Reply', 'Sent', 'Replies', 'Cumulative Replies', 'Cumulative Reply Rate (%)']
+    if sends.empty or replies.empty:
+        return pd.DataFrame(columns=columns)
+    today = pd.Timestamp(today or datetime.date.today())
+    sent_per_week = sends.groupby(_week(sends['day']).values)['sent'].sum()
+    counts = (
+        replies.groupby([_week(replies['day']).values, replies['days_to_reply'].astype(int).values])['replies']
+        .sum().unstack(fill_value=0)
+    )
+    counts = counts.reindex(index=sent_per_week.index, columns=range(int(counts.columns.max()) + 1), fill_value=0)
+    cumulative = counts.cumsum(axis=1)
+
+    last_send = sends.groupby(_week(sends['day']).values)['day'].max()
+    df = pd.DataFrame({
+        'Send Week': counts.index.repeat(counts.shape[1]),
+        'Days to Reply': list(counts.columns) * len(counts),
+        'Sent': sent_per_week.reindex(counts.index).repeat(counts.shape[1]).astype(int).values,
+        'Replies': counts.to_numpy().ravel().astype(int),
+        'Cumulative Replies': cumulative.to_numpy().ravel().astype(int),
+    })
+    df['Cumulative Reply Rate (%)'] = df['Cumulative Replies'] / df['Sent'] * 100
+    observed_until = pd.to_datetime(last_send.reindex(df['Send Week']).values) + pd.to_timedelta(df['Days to Reply'], 'D')
+    df = df[observed_until.values < today]
+    df['Send Week'] = df['Send Week'].dt.date
+    return df[columns].reset_index(drop=True)
+
+
+def cohort_rates_frame(sends, replies, max_days=None, today=None):
+    """
+    Per-agent reply and lead rates of the window's sends. With max_days only
+    replies within that many days count, and only sends at least that old,
+    so every agent is measured over the same horizon.
+    """
+    if max_days is not None:
+        today = pd.Timestamp(today or datetime.date.today())
+        sends = sends[pd.to_datetime(sends['day']) + pd.Timedelta(days=max_days) < today]
+        replies = replies[(pd.to_datetime(replies['day']) + pd.Timedelta(days=max_days) < today)
+                          & (replies['days_to_reply'] < max_days)]
+    counts = pd.concat([
+        sends.groupby('ai_agent')['sent'].sum(),
+        replies.groupby('ai_agent')[['replies', 'leads']].sum(),
+    ], axis=1).fillna(0)
+    counts.index.name = 'ai_agent'
+    return funnel_frame(counts.reset_index(), 'ai_agent')
+
+
+def load_cohorts(engine, start_dt, end_dt, max_days=None):
+    """Returns (matrix, agent rates) for the sends in the window."""
+    with engine.connect() as conn:
+        sends, replies = query_cohort_counts(conn, start_dt, end_dt)
+    return cohort_matrix_frame(sends, replies), cohort_rates_frame(sends, replies, max_days=max_days)
+
+
+# --- MIGRATION ---
+# Existing tables get the column, its index and links for their replies:
+# every reply is matched to the latest email sent to its sender at or before
+# it (an as-of join per contact, done in pandas), then written back in
+# batched UPDATEs. Replies that already have a link are left alone.
+
+def has_reply_links(bind):
+    """False on a table created before reply_to_id, until migrate() has run."""
+    return any(c.name == 'reply_to_id' for c in existing_columns(bind))
+
+
+def add_reply_to_column(engine):
+    if has_reply_links(engine):
+        return False
+    print("Adding emails.reply_to_id...")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"ALTER TABLE {emails.name} ADD COLUMN reply_to_id INTEGER")
+    return True
+
+
+def backfill_reply_to(engine, batch_size=BACKFILL_BATCH):
+    """
+    Link unlinked replies to the email they answer. Returns the number of
+    replies linked. Refuses a SQLite database with sealed months: the
+    UPDATEs only reach the hot emails table.
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite" and partitions.sqlite_shards(conn):
+            raise RuntimeError("emails has sealed months (see partitions.py); backfill before sealing")
+        replies = pd.read_sql(
+            select(emails.c.id, emails.c.sender_email.label('contact'), emails.c.timestamp)
+            .where(emails.c.direction == 'received', emails.c.is_reply, emails.c.reply_to_id.is_(None)),
+            conn,
+        )
+        if replies.empty:
+            return 0
+        sends = pd.read_sql(
+            select(emails.c.id.label('reply_to_id'), emails.c.recipient_email.label('contact'), emails.c.timestamp)
+            .where(emails.c.direction == 'sent', emails.c.recipient_email.is_not(None)),
+            conn,
+        )
+    for df in (replies, sends):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    links = pd.merge_asof(
+        replies.dropna(subset=['contact']).sort_values('timestamp'), sends.sort_values('timestamp'),
+        on='timestamp', by='contact', direction='backward',
+    ).dropna(subset=['reply_to_id'])
+    stmt = update(emails).where(emails.c.id == bindparam('reply_id')).values(reply_to_id=bindparam('link'))
+    params = [{'reply_id': int(r), 'link': int(s)} for r, s in zip(links['id'], links['reply_to_id'])]
+    for offset in range(0, len(params), batch_size):
+        with engine.begin() as conn:
+            conn.execute(stmt, params[offset:offset + batch_size])
+    return len(params)
+
+
+def migrate(engine):
+    add_reply_to_column(engine)
+    linked = backfill_reply_to(engine)
+    print(f"Linked {linked:,} replies to their sent emails.")
+    indexes.upgrade(engine)
+    return linked
+
+
+# --- VERIFICATION ---
+
+def _raw_cohort_counts(engine, start_dt, end_dt):
+    # The same counts from whole rows joined in pandas
+    with engine.connect() as conn:
+        raw = pd.read_sql(select(emails), conn)
+    raw['timestamp'] = pd.to_datetime(raw['timestamp'])
+    sends = raw[(raw['direction'] == 'sent') & raw['timestamp'].between(start_dt, end_dt)].copy()
+    sends['day'] = sends['timestamp'].dt.date
+    joined = raw[raw['reply_to_id'].notna()].merge(sends, left_on='reply_to_id', right_on='id', suffixes=('', '_sent'))
+    joined['days_to_reply'] = joined['reply_time_delta_seconds'] // SECONDS_PER_DAY
+    joined['lead'] = joined['reply_sentiment'] == 'positive'
+    replies = (
+        joined.groupby(['day', 'ai_agent_sent', 'days_to_reply'])
+        .agg(replies=('id', 'size'), leads=('lead', 'sum')).reset_index()
+        .rename(columns={'ai_agent_sent': 'ai_agent'})
+    )
+    sends = sends.groupby(['day', 'ai_agent']).size().rename('sent').reset_index()
+    return sends, replies
+
+
+def check_cohorts(num_rows=40_000, seed=5):
+    """
+    Generate linked data, compare the SQL cohorts with a pandas join of the
+    raw rows over a few windows, then drop every link and check that the
+    migration restores them exactly.
+    """
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'cohort_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        generate_mock_data_fast(engine, num_rows=num_rows, days=60, seed=seed)
+        today = datetime.date.today()
+        for days in (7, 30, 90):
+            start_dt = datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time.min)
+            end_dt = datetime.datetime.combine(today, datetime.time.max)
+            with engine.connect() as conn:
+                sends, replies = query_cohort_counts(conn, start_dt, end_dt)
+            raw_sends, raw_replies = _raw_cohort_counts(engine, start_dt, end_dt)
+            bad = []
+            for max_days in (None, 3, 7):
+                try:
+                    pd.testing.assert_frame_equal(cohort_rates_frame(sends, replies, max_days),
+                                                  cohort_rates_frame(raw_sends, raw_replies, max_days),
+                                                  check_dtype=False)
+                except AssertionError as e:
+                    print(e)
+                    bad.append(f"rates({max_days})")
+            try:
+                pd.testing.assert_frame_equal(cohort_matrix_frame(sends, replies),
+                                              cohort_matrix_frame(raw_sends, raw_replies), check_dtype=False)
+            except AssertionError as e:
+                print(e)
+                bad.append("matrix")
+            print(f"{days:>4} days: {int(sends['sent'].sum()):,} sends, {int(replies['replies'].sum()):,} replies: "
+                  f"{'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+            ok = ok and not bad
+
+        with engine.connect() as conn:
+            expected = pd.read_sql(select(emails.c.id, emails.c.reply_to_id).order_by(emails.c.id), conn)
+        # Back to a table from before reply_to_id: the readers of whole rows
+        # still work (reply_to_id all null) and the migration restores every link
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_emails_reply_to")
+            conn.exec_driver_sql(f"ALTER TABLE {emails.name} DROP COLUMN reply_to_id")
+        start_dt = datetime.datetime.combine(today - datetime.timedelta(days=90), datetime.time.min)
+        end_dt = datetime.datetime.combine(today, datetime.time.max)
+        frame = IncrementalLoader(engine).load(start_dt, end_dt)
+        with contextlib.redirect_stdout(io.StringIO()):
+            snapshot.export_snapshot(engine, os.path.join(tmp, 'snapshot'), full=True)
+        exported = snapshot.load_window(os.path.join(tmp, 'snapshot'), start_dt, end_dt)
+        with engine.connect() as conn:
+            in_window = conn.execute(select(func.count()).where(emails.c.timestamp.between(start_dt, end_dt))).scalar()
+        old_schema = (not has_reply_links(engine) and len(frame) == len(exported) == in_window
+                      and frame['reply_to_id'].isna().all() and exported['reply_to_id'].isna().all())
+        print(f"unmigrated table: {len(frame):,} rows loaded, {len(exported):,} exported: "
+              f"{'OK' if old_schema else 'MISMATCH'}")
+        linked = migrate(engine)
+        with engine.connect() as conn:
+            restored = pd.read_sql(select(emails.c.id, emails.c.reply_to_id).order_by(emails.c.id), conn)
+        same = expected.equals(restored)
+        print(f"migration: {linked:,} replies linked: {'OK' if same else 'MISMATCH'}")
+        ok = ok and old_schema and same
+        engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send-week reply cohorts and the reply_to_id migration.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="add emails.reply_to_id to an existing table and link its replies")
+    parser.add_argument("--check", action="store_true", help="verify on a generated SQLite dataset")
+    parser.add_argument("--rows", type=int, default=40_000, help="mock rows for --check")
+    parser.add_argument("--days", type=int, default=90, help="window of sends, ending today")
+    parser.add_argument("--max-days", type=int, default=None, help="count only replies within this many days")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check_cohorts(args.rows) else 1)
+
+    engine = partitions.install(create_engine(DB_URL))
+    if args.migrate:
+        migrate(engine)
+        return
+    today = datetime.date.today()
+    matrix, rates = load_cohorts(
+        engine,
+        datetime.datetime.combine(today - datetime.timedelta(days=args.days), datetime.time.min),
+        datetime.datetime.combine(today, datetime.time.max),
+        max_days=args.max_days,
+    )
+    table = matrix.pivot(index='Send Week', columns='Days to Reply', values='Cumulative Reply Rate (%)')
+    print(table.round(1).to_string())
+    print()
+    print(rates.round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
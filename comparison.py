@@ -0,0 +1,242 @@
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select, func, case, and_
+
+import partitions
+import queries
+import rollup
+from frame_schema import read_window
+from metrics import CUBE_PANELS, FUNNEL_DIMENSIONS, cube_panels, dimension_cube
+from mock_db import Base, Email, DB_URL, generate_mock_data_fast
+from queries import IS_SENT, IS_REPLY, IS_LEAD, count_if
+from streaming import DEFAULT_CHUNKSIZE, iter_window_chunks, _mismatches
+
+emails = Email.__table__
+
+PERIODS = ['current', 'previous']
+CUBE_MEASURES = ['emails', 'sent', 'replies', 'leads', 'reply_time_sum', 'reply_time_count']
+
+# --- PERIOD-OVER-PERIOD COMPARISON ---
+# The window is compared with the equal-length period right before it. Both
+# periods are read as one span: every row (or rollup day) is tagged with its
+# period, and a single aggregation yields the dimension cube (see
+# metrics.dimension_cube) with a leading period level. Both periods' cube
+# panels and their deltas are finished from that small cube, so a
+# comparison costs one scan of twice the rows, not two full panel loads.
+
+
+def previous_period(start_dt, end_dt):
+    """The period of the same length that ends right before start_dt."""
+    previous_end = start_dt - datetime.timedelta(microseconds=1)
+    return previous_end - (end_dt - start_dt), previous_end
+
+
+def _cube(df):
+    # Period-tagged SQL result -> the dimension_cube() layout
+    if df.empty:
+        return pd.DataFrame({m: pd.Series(dtype='int64') for m in CUBE_MEASURES},
+                            index=pd.MultiIndex.from_arrays([[]] * 5, names=['period'] + FUNNEL_DIMENSIONS))
+    return df.set_index(['period'] + FUNNEL_DIMENSIONS)[CUBE_MEASURES].astype('int64')
+
+
+def query_period_cube(conn, start_dt, end_dt):
+    previous_start, _ = previous_period(start_dt, end_dt)
+    period = case((emails.c.timestamp >= start_dt, 'current'), else_='previous').label('period')
+    dims = [emails.c[dim] for dim in FUNNEL_DIMENSIONS]
+    seconds = emails.c.reply_time_delta_seconds
+    stmt = (
+        select(
+            period, *dims,
+            func.count().label('emails'),
+            count_if(IS_SENT).label('sent'),
+            count_if(IS_REPLY).label('replies'),
+            count_if(IS_LEAD).label('leads'),
+            func.coalesce(func.sum(case((IS_REPLY, seconds), else_=0)), 0).label('reply_time_sum'),
+            count_if(and_(IS_REPLY, seconds.is_not(None))).label('reply_time_count'),
+        )
+        .where(queries.in_window(previous_start, end_dt))
+        .group_by(period, *dims)
+    )
+    return _cube(pd.read_sql(stmt, conn))
+
+
+def query_rollup_period_cube(conn, start_dt, end_dt):
+    # Whole days, like every rollup panel
+    previous_start, _ = previous_period(start_dt, end_dt)
+    table = rollup.rollup
+    period = case((table.c.day >= start_dt.date(), 'current'), else_='previous').label('period')
+    dims = [table.c[dim] for dim in FUNNEL_DIMENSIONS]
+    stmt = (
+        select(
+            period, *dims,
+            func.coalesce(func.sum(table.c.email_count), 0).label('emails'),
+            rollup.sum_if(rollup.R_SENT).label('sent'),
+            rollup.sum_if(rollup.R_REPLY).label('replies'),
+            rollup.sum_if(rollup.R_LEAD).label('leads'),
+            rollup.sum_if(rollup.R_REPLY, table.c.reply_time_sum).label('reply_time_sum'),
+            rollup.sum_if(rollup.R_REPLY, table.c.reply_time_count).label('reply_time_count'),
+        )
+        .where(rollup.in_window(previous_start, end_dt))
+        .group_by(period, *dims)
+    )
+    return _cube(pd.read_sql(stmt, conn))
+
+
+def frame_period_cube(df, start_dt):
+    """The period cube of raw rows covering both periods (rows from start_dt on are 'current')."""
+    current = (pd.to_datetime(df['timestamp']) >= start_dt).to_numpy()
+    period = ('period', np.where(current, 1, 2), np.array([np.nan] + PERIODS, dtype=object))
+    return dimension_cube(df, [period])
+
+
+def stream_period_cube(engine, start_dt, end_dt, chunksize=DEFAULT_CHUNKSIZE):
+    previous_start, _ = previous_period(start_dt, end_dt)
+    cube = None
+    with engine.connect() as conn:
+        for chunk in iter_window_chunks(conn, previous_start, end_dt, chunksize=chunksize):
+            part = frame_period_cube(chunk, start_dt)
+            cube = part if cube is None else cube.add(part, fill_value=0).astype('int64')
+    return cube if cube is not None else _cube(pd.DataFrame())
+
+
+def _add_deltas(frame, before, dim):
+    # before: sent/replies/leads per value of dim in the previous period
+    before = before.reindex(frame[dim].to_numpy())
+    sent = before['sent'].to_numpy(dtype='float64')
+    sent[~(sent > 0)] = np.nan
+    frame['Δ Total Sent'] = frame['Total Sent'].to_numpy() - sent
+    for rate, count in (('Reply Rate (%)', 'replies'), ('Lead Rate (%)', 'leads')):
+        if rate in frame:
+            previous_rate = before[count].to_numpy(dtype='float64') / sent * 100
+            frame[f"Δ {rate.replace('(%)', '(pp)')}"] = frame[rate].to_numpy() - previous_rate
+    return frame
+
+
+def comparison_panels(cube, panels=None):
+    """
+    The CUBE_PANELS of the current period from a period cube, with the
+    change from the previous period: the metrics panel gains a previous_*
+    column per value, rate tables gain Δ Total Sent and Δ <rate> (pp)
+    (NaN where a value had no sends before). Only the current period is
+    shaped into panels; the previous one is reduced to the counts the
+    deltas need.
+    """
+    period = cube.index.get_level_values('period')
+    previous = cube[period == 'previous'].droplevel('period')
+    results = cube_panels(cube[period == 'current'].droplevel('period'), panels)
+    for name, frame in results.items():
+        if name == 'metrics':
+            before = cube_panels(previous, ['metrics'])['metrics']
+            for column in before.columns:
+                frame[f'previous_{column}'] = before[column].to_numpy()
+        else:
+            dim = frame.columns[0]
+            _add_deltas(frame, previous.groupby(level=dim, observed=True)[['sent', 'replies', 'leads']].sum(), dim)
+    return results
+
+
+def load_comparison(engine, start_dt, end_dt, source="sql", panels=None):
+    """Compared CUBE_PANELS of the window; source: sql, rollup (update it first) or stream."""
+    if source == "stream":
+        cube = stream_period_cube(engine, start_dt, end_dt)
+    else:
+        query = query_rollup_period_cube if source == "rollup" else query_period_cube
+        with engine.connect() as conn:
+            cube = query(conn, start_dt, end_dt)
+    return comparison_panels(cube, panels)
+
+
+# --- VERIFICATION ---
+
+def _expected_deltas(current, previous):
+    # The comparison rebuilt from two independently loaded single-period panels
+    if 'total_sent' in current:
+        frame = current.copy()
+        for column in current.columns:
+            frame[f'previous_{column}'] = previous[column].to_numpy()
+        return frame
+    dim = current.columns[0]
+    before = previous.set_index(dim)
+    frame = current.copy()
+    frame['Δ Total Sent'] = frame['Total Sent'] - frame[dim].map(before['Total Sent'])
+    for column in [c for c in current.columns if c.endswith('Rate (%)')]:
+        frame[f"Δ {column.replace('(%)', '(pp)')}"] = frame[column] - frame[dim].map(before[column])
+    return frame
+
+
+def check_comparison(num_rows=40_000, seed=11):
+    """
+    Every source's comparison must equal the deltas between the plain
+    panels of both periods. Also prints what one comparison costs next to
+    one single-period load of the same panels.
+    """
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'comparison_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        generate_mock_data_fast(engine, num_rows=num_rows, days=120, seed=seed)
+        rollup.update_rollup(engine)
+        today = datetime.date.today()
+        for days in (1, 7, 30):
+            start_dt = datetime.datetime.combine(today - datetime.timedelta(days=days - 1), datetime.time.min)
+            end_dt = datetime.datetime.combine(today, datetime.time.max)
+            current = queries.load_panels(engine, start_dt, end_dt, CUBE_PANELS)
+            previous = queries.load_panels(engine, *previous_period(start_dt, end_dt), CUBE_PANELS)
+            expected = {name: _expected_deltas(current[name], previous[name]) for name in CUBE_PANELS}
+
+            def frame():
+                with engine.connect() as conn:
+                    df = read_window(conn, previous_period(start_dt, end_dt)[0], end_dt)
+                return comparison_panels(frame_period_cube(df, start_dt))
+
+            sources = {
+                'sql': lambda: load_comparison(engine, start_dt, end_dt),
+                'rollup': lambda: load_comparison(engine, start_dt, end_dt, source="rollup"),
+                'stream': lambda: load_comparison(engine, start_dt, end_dt, source="stream"),
+                'frame': frame,
+            }
+            t0 = time.perf_counter()
+            queries.load_panels(engine, start_dt, end_dt, CUBE_PANELS)
+            single_ms = (time.perf_counter() - t0) * 1000
+            for source, load in sources.items():
+                t0 = time.perf_counter()
+                compared = load()
+                elapsed_ms = (time.perf_counter() - t0) * 1000
+                bad = _mismatches(compared, expected)
+                print(f"{days:>3} days {source:<6}: {elapsed_ms:7.1f} ms (single period, sql: {single_ms:.1f} ms): "
+                      f"{'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+                ok = ok and not bad
+        engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the cube panels of a window with the period before it.")
+    parser.add_argument("--check", action="store_true", help="verify on a generated SQLite dataset")
+    parser.add_argument("--rows", type=int, default=40_000, help="mock rows for --check")
+    parser.add_argument("--days", type=int, default=7, help="window length, ending today")
+    parser.add_argument("--source", choices=["sql", "rollup", "stream"], default="sql")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check_comparison(args.rows) else 1)
+
+    engine = partitions.install(create_engine(DB_URL))
+    if args.source == "rollup":
+        rollup.update_rollup(engine)
+    today = datetime.date.today()
+    start_dt = datetime.datetime.combine(today - datetime.timedelta(days=args.days - 1), datetime.time.min)
+    end_dt = datetime.datetime.combine(today, datetime.time.max)
+    for name, frame in load_comparison(engine, start_dt, end_dt, source=args.source).items():
+        print(f"\n[{name}]")
+        print(frame.round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
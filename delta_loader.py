@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import select, func, and_
+
+import id_watermarks
+from frame_schema import concat_frames
+from mock_db import Email, existing_columns
+
+emails = Email.__table__
+
+
+class _Window:
+    def __init__(self, start_dt, end_dt, frame, last_id):
+        self.start_dt = start_dt
+        self.end_dt = end_dt
+        self.frame = frame
+        self.last_id = last_id
+        self.gap_ids = []  # ids up to last_id not committed when the frame was read
+
+
+class IncrementalLoader:
+    """
+    Keeps the raw emails frame of recently used date windows in memory and
+    refreshes it from a watermark on emails.id instead of re-reading the
+    whole window.
+
+    - Same window again: fetch only rows with id above the watermark.
+    - New window overlapping a cached one (e.g. the end date moved to today):
+      trim the cached frame to the new window, fetch the uncovered time
+      ranges and the new ids.
+    - Otherwise: one full read of the window.
+
+    Every cached window remembers the ids below its watermark that were not
+    committed yet and fetches them once they appear (see id_watermarks.py).
+
+    Rows that are updated or deleted in place are not seen by the delta
+    query; call reset() to force full reloads.
+
+    columns limits the SELECT to those emails columns, and convert (e.g.
+    frame_schema.compact_frame) is applied to every fetched part.
+
+    Returned frames are shared between callers and must not be modified in
+    place.
+    """
+
+    def __init__(self, engine, max_windows=8, columns=None, convert=None):
+        self.engine = engine
+        self.max_windows = max_windows
+        self.columns = columns
+        self.convert = convert
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_columns = None
+        self.rows_fetched = 0
+        self.full_loads = 0
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+            self._table_columns = None
+
+    def load(self, start_dt, end_dt):
+        key = (start_dt, end_dt)
+        with self._lock:
+            with self.engine.connect() as conn:
+                max_id = conn.execute(select(func.coalesce(func.max(emails.c.id), 0))).scalar()
+                window = self._windows.get(key)
+                if window is not None and max_id < window.last_id:
+                    # Table was truncated or regenerated
+                    self._windows.clear()
+                    window = None
+                if window is not None:
+                    window.frame = self._append(window.frame, self._fetch(
+                        conn, in_window(start_dt, end_dt),
+                        id_watermarks.new_rows(window.last_id, max_id, window.gap_ids),
+                    ))
+                    window.last_id = max_id
+                    self._windows.move_to_end(key)
+                else:
+                    window = self._slide(conn, start_dt, end_dt, max_id)
+                    self._windows[key] = window
+                    while len(self._windows) > self.max_windows:
+                        self._windows.popitem(last=False)
+                # Read in the same transaction as the fetches, so it matches what they saw
+                window.gap_ids = id_watermarks.missing_ids(conn, max_id)
+            return window.frame
+
+    def _slide(self, conn, start_dt, end_dt, max_id):
+        base = None
+        for cached in reversed(self._windows.values()):
+            if cached.start_dt <= end_dt and start_dt <= cached.end_dt and cached.last_id <= max_id:
+                base = cached
+                break
+        if base is None:
+            self.full_loads += 1
+            frame = self._fetch(conn, in_window(start_dt, end_dt), emails.c.id <= max_id)
+            return _Window(start_dt, end_dt, frame, max_id)
+
+        ts = base.frame['timestamp']
+        parts = [base.frame[(ts >= start_dt) & (ts <= end_dt)]]
+        # Time ranges of the new window that the cached frame does not cover
+        if start_dt < base.start_dt:
+            parts.append(self._fetch(conn, emails.c.timestamp >= start_dt, emails.c.timestamp < base.start_dt,
+                                     emails.c.id <= max_id))
+        if end_dt > base.end_dt:
+            parts.append(self._fetch(conn, emails.c.timestamp > base.end_dt, emails.c.timestamp <= end_dt,
+                                     emails.c.id <= max_id))
+        # Rows of the covered range that arrived since the cached frame was read
+        parts.append(self._fetch(conn, in_window(max(start_dt, base.start_dt), min(end_dt, base.end_dt)),
+                                 id_watermarks.new_rows(base.last_id, max_id, base.gap_ids)))
+        frame = concat_frames(parts)
+        return _Window(start_dt, end_dt, frame, max_id)
+
+    def _fetch(self, conn, *conditions):
+        # Fixed dtype so an all-NULL delta does not turn the column into objects on concat
+        if self.columns:
+            columns = [emails.c[c] for c in self.columns]
+        else:
+            # Every column the table has; an unmigrated one gets reply_to_id as nulls
+            if self._table_columns is None:
+                self._table_columns = existing_columns(conn)
+            columns = self._table_columns
+        df = pd.read_sql(select(*columns).where(and_(*conditions)).order_by(emails.c.id), conn,
+                         dtype={'reply_time_delta_seconds': 'float64'})
+        if not self.columns:
+            df = df.reindex(columns=[c.name for c in emails.columns])
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        self.rows_fetched += len(df)
+        return self.convert(df) if self.convert is not None else df
+
+    @staticmethod
+    def _append(frame, new_rows):
+        if new_rows.empty:
+            return frame
+        return concat_frames([frame, new_rows])
+
+
+def in_window(start_dt, end_dt):
+    return emails.c.timestamp.between(start_dt, end_dt)
@@ -0,0 +1,167 @@
+import argparse
+import datetime
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, select, text
+
+from mock_db import (
+    Email, DB_URL,
+    AGENTS, UNASSIGNED_AGENTS, CITIES, INDUSTRIES, COMPANY_SIZES, CONTACT_TITLES,
+)
+
+# --- EXPLICIT SCHEMA FOR LOADED EMAIL FRAMES ---
+# Only the columns some panel reads are projected. sender_email and
+# recipient_email are dropped, and no reply_time_delta timedelta column is
+# added next to the integer seconds.
+
+emails = Email.__table__
+
+# Low-cardinality columns -> fixed categories from the model's Enum or the
+# known domain. Values outside the domain are appended as extra categories
+# instead of being lost.
+CATEGORY_DOMAINS = {
+    'direction': list(emails.c.direction.type.enums),
+    'reply_sentiment': list(emails.c.reply_sentiment.type.enums),
+    'ai_agent': AGENTS + UNASSIGNED_AGENTS,
+    'city': CITIES,
+    'company_industry': INDUSTRIES,
+    'company_size': COMPANY_SIZES,
+    'contact_title': CONTACT_TITLES,
+}
+
+EMAIL_FRAME_SCHEMA = {
+    'id': 'int64',
+    'timestamp': 'datetime64[ns]',
+    'direction': 'category',
+    'is_reply': 'bool',
+    'company_name': 'string',
+    'company_size': 'category',
+    'company_industry': 'category',
+    'contact_title': 'category',
+    'reply_sentiment': 'category',
+    'ai_agent': 'category',
+    'city': 'category',
+    'reply_time_delta_seconds': 'Int32',
+}
+
+PROJECTED_COLUMNS = list(EMAIL_FRAME_SCHEMA)
+
+
+def _categories(column, values):
+    known = CATEGORY_DOMAINS[column]
+    extra = pd.unique(values.dropna().astype(str))
+    return known + sorted(set(extra) - set(known))
+
+
+def compact_frame(df):
+    """Project df onto EMAIL_FRAME_SCHEMA and convert every column to its compact dtype."""
+    out = {}
+    for column, dtype in EMAIL_FRAME_SCHEMA.items():
+        values = df[column]
+        if dtype == 'category':
+            out[column] = pd.Categorical(values, categories=_categories(column, values))
+        elif dtype == 'bool':
+            out[column] = values.fillna(False).astype(bool)
+        elif dtype == 'datetime64[ns]':
+            out[column] = pd.to_datetime(values).astype('datetime64[ns]')
+        else:
+            out[column] = values.astype(dtype)
+    return pd.DataFrame(out, index=df.index)
+
+
+def concat_frames(frames):
+    """
+    pd.concat that keeps categorical columns categorical when the parts
+    picked up different extra categories.
+    """
+    frames = [f for f in frames if not f.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    aligned = frames
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = list(frames[0][column].cat.categories)
+            for f in frames[1:]:
+                categories += [c for c in f[column].cat.categories if c not in categories]
+            aligned = [f.assign(**{column: f[column].cat.set_categories(categories)}) for f in aligned]
+    return pd.concat(aligned, ignore_index=True)
+
+
+def window_statement(start_dt, end_dt):
+    return (
+        select(*[emails.c[c] for c in PROJECTED_COLUMNS])
+        .where(emails.c.timestamp.between(start_dt, end_dt))
+    )
+
+
+def read_window(conn, start_dt, end_dt):
+    """Read the window with the projected columns only and return a compact frame."""
+    return compact_frame(pd.read_sql(window_statement(start_dt, end_dt), conn))
+
+
+# --- MEMORY / TIMING REPORT ---
+
+GROUPBY_COLUMNS = ['direction', 'reply_sentiment', 'contact_title', 'ai_agent', 'city', 'company_industry']
+
+
+def _time_groupbys(df, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for column in GROUPBY_COLUMNS:
+            df.groupby(column, observed=True).size()
+        df[df['direction'] == 'sent'].groupby(['city', 'company_industry'], observed=True).size()
+    return (time.perf_counter() - start) / repeat
+
+
+def report(engine, start_dt, end_dt):
+    """
+    Load one window both ways (the current SELECT * object-dtype frame and
+    the compact frame) and print memory use and groupby time for each.
+    """
+    with engine.connect() as conn:
+        t0 = time.perf_counter()
+        legacy = pd.read_sql(
+            text("SELECT * FROM emails WHERE timestamp BETWEEN :start AND :end"), conn,
+            params={"start": start_dt, "end": end_dt}, parse_dates=['timestamp'],
+        )
+        legacy['reply_time_delta'] = pd.to_timedelta(legacy['reply_time_delta_seconds'], unit='s')
+        # The current frame holds these columns as Python object strings
+        for column in legacy.columns:
+            if pd.api.types.is_string_dtype(legacy[column]):
+                legacy[column] = legacy[column].astype(object)
+        legacy_load = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        compact = read_window(conn, start_dt, end_dt)
+        compact_load = time.perf_counter() - t0
+
+    rows = []
+    for name, df, load_s in (('object', legacy, legacy_load), ('compact', compact, compact_load)):
+        rows.append({
+            'frame': name,
+            'rows': len(df),
+            'columns': df.shape[1],
+            'memory_mb': df.memory_usage(deep=True).sum() / 2**20,
+            'load_s': load_s,
+            'groupby_s': _time_groupbys(df),
+        })
+    result = pd.DataFrame(rows).set_index('frame')
+    print(result.to_string(float_format=lambda v: f"{v:.4f}"))
+    if len(legacy):
+        print(f"\nMemory: {result.loc['object', 'memory_mb'] / result.loc['compact', 'memory_mb']:.1f}x smaller, "
+              f"groupbys: {result.loc['object', 'groupby_s'] / result.loc['compact', 'groupby_s']:.1f}x faster")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the object-dtype and compact email frames.")
+    parser.add_argument("--days", type=int, default=90, help="window length ending today")
+    args = parser.parse_args()
+    end_dt = datetime.datetime.combine(datetime.date.today(), datetime.time.max)
+    start_dt = datetime.datetime.combine(end_dt.date() - datetime.timedelta(days=args.days), datetime.time.min)
+    report(create_engine(DB_URL), start_dt, end_dt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from sqlalchemy import Column, Integer, String, select, insert, delete, and_, or_
+
+from mock_db import Base, Email
+
+emails = Email.__table__
+
+# --- ID WATERMARKS OF THE INCREMENTAL BUILDERS ---
+# The rollup and the sketches fold the emails rows above a stored id
+# watermark (the incremental loader and the snapshot export read the same
+# way). An id is handed out at insert but the row only becomes visible
+# at commit, so on MySQL a row can commit after a higher id was already
+# folded. Every fold therefore records the ids it did not see among the
+# last ID_MARGIN ids up to its new watermark (gaps: in-flight inserts,
+# rollbacks, deleted rows) and the next fold also takes in the gap ids that
+# have appeared since. A row committing more than ID_MARGIN ids late is
+# still missed; rebuilding the rollup or the sketches picks it up.
+
+ID_MARGIN = 5000
+
+
+class FoldGap(Base):
+    __tablename__ = "email_fold_gap"
+
+    fold = Column(String(32), primary_key=True)
+    email_id = Column(Integer, primary_key=True, autoincrement=False)
+
+
+gaps = FoldGap.__table__
+
+
+def ensure_state_row(engine, table, **values):
+    """
+    Insert a builder's state row unless it exists, in its own transaction.
+    Concurrent first runs both get past this; the loser's insert is ignored.
+    """
+    stmt = (
+        insert(table).values(**values)
+        .prefix_with("IGNORE", dialect="mysql")
+        .prefix_with("OR IGNORE", dialect="sqlite")
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt)
+
+
+def pending_gaps(conn, fold):
+    return conn.execute(select(gaps.c.email_id).where(gaps.c.fold == fold)).scalars().all()
+
+
+def new_rows(last_id, max_id, gap_ids=()):
+    """emails condition: ids above last_id up to max_id, plus the gap ids of the last fold."""
+    above = and_(emails.c.id > last_id, emails.c.id <= max_id)
+    return or_(above, emails.c.id.in_(gap_ids)) if gap_ids else above
+
+
+def missing_ids(conn, max_id, margin=ID_MARGIN):
+    """The ids missing among the last `margin` ids up to max_id."""
+    low = max(max_id - margin, 0)
+    present = set(conn.execute(select(emails.c.id).where(emails.c.id > low, emails.c.id <= max_id)).scalars())
+    return [email_id for email_id in range(low + 1, max_id + 1) if email_id not in present]
+
+
+def record_gaps(conn, fold, max_id, margin=ID_MARGIN):
+    """Replace the fold's gaps with the ids missing among the last `margin` ids up to max_id."""
+    missing = missing_ids(conn, max_id, margin)
+    conn.execute(delete(gaps).where(gaps.c.fold == fold))
+    if missing:
+        conn.execute(gaps.insert(), [{'fold': fold, 'email_id': email_id} for email_id in missing])
+    return len(missing)
@@ -0,0 +1,163 @@
+import argparse
+import datetime
+import statistics
+import time
+
+from sqlalchemy import create_engine, event, inspect
+
+import queries
+from mock_db import Email, DB_URL, existing_columns
+
+emails = Email.__table__
+
+# The dashboard indexes are declared on the Email model; everything except the
+# primary key and the implicit id index is managed by this migration.
+DASHBOARD_INDEXES = [ix for ix in emails.indexes if ix.name != 'ix_emails_id']
+
+
+# --- MIGRATION ---
+
+def existing_indexes(engine):
+    return {ix['name'] for ix in inspect(engine).get_indexes(emails.name)}
+
+
+def upgrade(engine):
+    """
+    Create the dashboard indexes that an existing emails table lacks. Data is
+    untouched. Indexes on columns the table does not have yet (reply_to_id
+    before `cohorts.py --migrate`) are skipped.
+    """
+    present = existing_indexes(engine)
+    columns = {c.name for c in existing_columns(engine)}
+    created = []
+    for index in DASHBOARD_INDEXES:
+        missing = [c.name for c in index.columns if c.name not in columns]
+        if missing:
+            print(f"Skipping {index.name}: emails lacks {', '.join(missing)} (run `python cohorts.py --migrate`).")
+        elif index.name not in present:
+            print(f"Creating {index.name} ({', '.join(c.name for c in index.columns)})...")
+            index.create(bind=engine)
+            created.append(index.name)
+    if not created:
+        print("All dashboard indexes already exist.")
+    return created
+
+
+def downgrade(engine):
+    """Drop the dashboard indexes again."""
+    present = existing_indexes(engine)
+    dropped = []
+    for index in DASHBOARD_INDEXES:
+        if index.name in present:
+            print(f"Dropping {index.name}...")
+            index.drop(bind=engine)
+            dropped.append(index.name)
+    return dropped
+
+
+# --- EXPLAIN & TIMING ---
+
+def capture_panel_sql(engine, start_dt, end_dt):
+    """Run every dashboard panel once and return {panel: [(sql, params), ...]} as sent to the driver."""
+    captured = {}
+    current = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        current.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with engine.connect() as conn:
+            for name, panel_query in queries.PANEL_QUERIES.items():
+                current.clear()
+                panel_query(conn, start_dt, end_dt)
+                captured[name] = list(current)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return captured
+
+
+def explain(conn, statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    result = conn.exec_driver_sql(prefix + statement, parameters)
+    columns = list(result.keys())
+    return [dict(zip(columns, row)) for row in result]
+
+
+def time_panels(engine, start_dt, end_dt, repeat=5):
+    timings = {}
+    with engine.connect() as conn:
+        for name, panel_query in queries.PANEL_QUERIES.items():
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                panel_query(conn, start_dt, end_dt)
+                samples.append(time.perf_counter() - t0)
+            timings[name] = statistics.median(samples)
+    return timings
+
+
+def report(engine, start_dt, end_dt, label, repeat=5):
+    print(f"\n===== {label} (indexes: {', '.join(sorted(existing_indexes(engine))) or 'none'}) =====")
+    timings = time_panels(engine, start_dt, end_dt, repeat=repeat)
+    captured = capture_panel_sql(engine, start_dt, end_dt)
+    with engine.connect() as conn:
+        for name, statements in captured.items():
+            print(f"\n--- {name}: {timings[name] * 1000:.2f} ms (median of {repeat}) ---")
+            for statement, parameters in statements:
+                for row in explain(conn, statement, parameters):
+                    if conn.dialect.name == "sqlite":
+                        print(f"  {row.get('detail')}")
+                    else:
+                        print("  " + ", ".join(f"{k}={v}" for k, v in row.items() if v is not None))
+    return timings
+
+
+def compare(engine, start_dt, end_dt, repeat=5, allow_live=False):
+    """
+    Print plans and timings without the dashboard indexes, then with them.
+    This drops and rebuilds every dashboard index, so anything but SQLite
+    needs allow_live=True.
+    """
+    if engine.dialect.name != "sqlite" and not allow_live:
+        raise RuntimeError(f"compare drops and rebuilds every dashboard index on this {engine.dialect.name} "
+                           "database; pass --yes to do it anyway")
+    downgrade(engine)
+    before = report(engine, start_dt, end_dt, "BEFORE", repeat=repeat)
+    upgrade(engine)
+    after = report(engine, start_dt, end_dt, "AFTER", repeat=repeat)
+    print("\n===== SUMMARY (ms) =====")
+    print(f"{'panel':<18}{'before':>10}{'after':>10}{'speedup':>10}")
+    for name in before:
+        b, a = before[name] * 1000, after[name] * 1000
+        print(f"{name:<18}{b:>10.2f}{a:>10.2f}{(b / a if a else float('inf')):>9.1f}x")
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage and evaluate the emails table indexes.")
+    parser.add_argument("command", choices=["upgrade", "downgrade", "explain", "compare"])
+    parser.add_argument("--days", type=int, default=7, help="dashboard window length ending today")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions per panel")
+    parser.add_argument("--yes", action="store_true",
+                        help="compare: allow dropping and rebuilding the indexes of a non-SQLite database")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    end_dt = datetime.datetime.combine(datetime.date.today(), datetime.time.max)
+    start_dt = datetime.datetime.combine(end_dt.date() - datetime.timedelta(days=args.days), datetime.time.min)
+    if args.command == "upgrade":
+        upgrade(engine)
+    elif args.command == "downgrade":
+        downgrade(engine)
+    elif args.command == "explain":
+        report(engine, start_dt, end_dt, "CURRENT", repeat=args.repeat)
+    else:
+        try:
+            compare(engine, start_dt, end_dt, repeat=args.repeat, allow_live=args.yes)
+        except RuntimeError as e:
+            parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+# --- LIGHTWEIGHT SPANS FOR THE DASHBOARD HOT PATH ---
+# A "run" is one execution of the dashboard script. Spans opened while a run
+# is active on the current thread are recorded with their wall time, the
+# rows/bytes of their result and, for st.cache_data functions, whether the
+# cache was hit. Without an active run span() returns a shared no-op object,
+# so the library code can stay instrumented at the cost of one context
+# variable lookup per span. Worker threads started through
+# contextvars.copy_context().run record into the caller's run.
+
+_run = contextvars.ContextVar('instrumentation_run', default=None)
+# Open spans of the current context, innermost last (a tuple, so copied
+# contexts in worker threads cannot disturb the caller's stack)
+_stack = contextvars.ContextVar('instrumentation_stack', default=())
+_totals_lock = threading.Lock()
+# (name, kind) -> [count, seconds, rows, bytes]; (name, 'hit'|'miss') -> count
+_span_totals = {}
+_cache_totals = {}
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def result(self, obj):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('run', 'name', 'kind', 'cached', 'depth', 'start', 'seconds', 'rows', 'bytes', 'cache', 'error',
+                 '_result', '_token')
+
+    def __init__(self, run, name, kind, cached):
+        self.run = run
+        self.name = name
+        self.kind = kind
+        self.cached = cached
+        self.depth = len(_stack.get())
+        self.seconds = None
+        self.rows = None
+        self.bytes = None
+        self.cache = None
+        self.error = None
+        self._result = None
+
+    def result(self, obj):
+        """Remember the span's result; its rows and bytes are measured after the timer stops."""
+        self._result = obj
+
+    def __enter__(self):
+        self._token = _stack.set(_stack.get() + (self,))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        _stack.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        if self.cached and self.cache is None:
+            # The cached function body did not run, so it did not call cache_miss()
+            self.cache = 'hit'
+        if self._result is not None:
+            self.rows, self.bytes = frame_size(self._result)
+            self._result = None
+        self.run.spans.append(self)
+        return False
+
+    def as_dict(self):
+        return {
+            'run': self.run.run_id, 'name': self.name, 'kind': self.kind, 'depth': self.depth,
+            'seconds': self.seconds, 'rows': self.rows, 'bytes': self.bytes, 'cache': self.cache, 'error': self.error,
+        }
+
+
+class Run:
+    def __init__(self, label):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+
+    def frame(self):
+        """Spans in start order as a DataFrame (for the sidebar panel)."""
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return pd.DataFrame(
+            [s.as_dict() for s in spans],
+            columns=['run', 'name', 'kind', 'depth', 'seconds', 'rows', 'bytes', 'cache', 'error'],
+        )
+
+
+def frame_size(obj):
+    """(rows, bytes) of a DataFrame or a dict of DataFrames (a panels dict); (None, None) otherwise."""
+    if isinstance(obj, pd.DataFrame):
+        return len(obj), int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, dict):
+        sizes = [frame_size(v) for v in obj.values() if isinstance(v, pd.DataFrame)]
+        if sizes:
+            return sum(r for r, _ in sizes), sum(b for _, b in sizes)
+    return None, None
+
+
+# --- RECORDING API ---
+
+def start_run(label="dashboard"):
+    """Start recording spans in the current context, replacing any unfinished run."""
+    run = Run(label)
+    _run.set(run)
+    _stack.set(())
+    return run
+
+
+def current_run():
+    return _run.get()
+
+
+def span(name, kind="compute", cached=False):
+    """
+    Context manager timing one step. cached=True marks a call to an
+    st.cache_data function: it counts as a hit unless the function body
+    calls cache_miss() while the span is open.
+    """
+    run = _run.get()
+    if run is None:
+        return _NOOP
+    return Span(run, name, kind, cached)
+
+
+def cache_miss():
+    """Call at the top of a cached function body: marks the innermost cached span as a miss."""
+    if _run.get() is None:
+        return
+    for open_span in reversed(_stack.get()):
+        if open_span.cached:
+            open_span.cache = 'miss'
+            return
+
+
+def finish_run(jsonl_path=None, prom_path=None):
+    """Stop recording, update the process-wide totals and write the requested outputs."""
+    run = _run.get()
+    if run is None:
+        return None
+    _run.set(None)
+    run.seconds = time.perf_counter() - run.start
+    with _totals_lock:
+        for s in run.spans:
+            totals = _span_totals.setdefault((s.name, s.kind), [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += s.seconds
+            totals[2] += s.rows or 0
+            totals[3] += s.bytes or 0
+            if s.cache is not None:
+                _cache_totals[(s.name, s.cache)] = _cache_totals.get((s.name, s.cache), 0) + 1
+    if jsonl_path:
+        write_jsonl(run, jsonl_path)
+    if prom_path:
+        write_prometheus(prom_path)
+    return run
+
+
+# --- OUTPUTS ---
+
+def write_jsonl(run, path):
+    """Append one JSON object per span, plus one for the whole run."""
+    lines = [json.dumps({'run': run.run_id, 'name': run.label, 'kind': 'run', 'depth': -1,
+                         'seconds': run.seconds, 'ts': run.started_at})]
+    lines += [json.dumps({**s.as_dict(), 'ts': run.started_at}) for s in sorted(run.spans, key=lambda s: s.start)]
+    with _totals_lock, open(path, "a") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def write_prometheus(path):
+    """Rewrite a Prometheus text-format file with the cumulative totals of this process."""
+    with _totals_lock:
+        spans = sorted(_span_totals.items())
+        caches = sorted(_cache_totals.items())
+    out = []
+    for metric, index, help_text in (
+        ('dashboard_span_count_total', 0, 'Spans recorded.'),
+        ('dashboard_span_seconds_total', 1, 'Wall time spent in spans.'),
+        ('dashboard_span_rows_total', 2, 'Rows in span results.'),
+        ('dashboard_span_bytes_total', 3, 'Bytes in span results.'),
+    ):
+        out.append(f"# HELP {metric} {help_text}")
+        out.append(f"# TYPE {metric} counter")
+        for (name, kind), totals in spans:
+            out.append(f'{metric}{{span="{_label(name)}",kind="{_label(kind)}"}} {totals[index]}')
+    out.append("# HELP dashboard_cache_requests_total st.cache_data lookups by result.")
+    out.append("# TYPE dashboard_cache_requests_total counter")
+    for (name, result), count in caches:
+        out.append(f'dashboard_cache_requests_total{{span="{_label(name)}",result="{result}"}} {count}')
+    with open(path + '.tmp', 'w') as f:
+        f.write("\n".join(out) + "\n")
+    os.replace(path + '.tmp', path)
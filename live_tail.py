@@ -0,0 +1,249 @@
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, select, delete, func
+
+import partitions
+import queries
+from frame_schema import PROJECTED_COLUMNS
+from mock_db import Base, Email, DB_URL, generate_mock_data_fast
+from streaming import DEFAULT_CHUNKSIZE, PanelAccumulator, _mismatches
+
+emails = Email.__table__
+
+DEFAULT_DAYS = 1
+DEFAULT_POLL_SECONDS = 5
+DEFAULT_VERIFY_SECONDS = 60
+
+
+# --- LIVE TAIL ---
+# A background thread keeps every dashboard panel for the trailing `days`
+# days (today included) up to date: each poll reads only the emails with
+# id above the watermark and folds them into running aggregates, so its
+# cost is proportional to the new rows. After a poll that found rows the
+# panels are finished once and published as an immutable LiveSnapshot;
+# readers just take the current reference.
+#
+# New ids are the only changes a poll sees. A full resync re-reads the
+# window when the day rolls over, when the highest id went down (table
+# regenerated), when the periodic row-count check finds rows were deleted,
+# or on request_resync() (e.g. after rows were updated in place).
+
+class LiveSnapshot:
+    __slots__ = ('panels', 'since', 'until', 'rows', 'last_id', 'updated_at', 'resynced_at', 'error')
+
+    def __init__(self, panels, since, until, rows, last_id, updated_at, resynced_at, error=None):
+        self.panels = panels
+        self.since = since
+        self.until = until
+        self.rows = rows
+        self.last_id = last_id
+        self.updated_at = updated_at
+        self.resynced_at = resynced_at
+        self.error = error
+
+
+def live_window(days=DEFAULT_DAYS, today=None):
+    today = today or datetime.date.today()
+    return (datetime.datetime.combine(today - datetime.timedelta(days=days - 1), datetime.time.min),
+            datetime.datetime.combine(today, datetime.time.max))
+
+
+class LiveTailer:
+    """
+    Running panels for the trailing `days` days, fed from an id watermark.
+    start() loads the window and polls every poll_seconds on a daemon
+    thread; poll() and resync() can also be called directly.
+    """
+
+    def __init__(self, engine, days=DEFAULT_DAYS, poll_seconds=DEFAULT_POLL_SECONDS,
+                 verify_seconds=DEFAULT_VERIFY_SECONDS, chunksize=DEFAULT_CHUNKSIZE):
+        self.engine = engine
+        self.days = days
+        self.poll_seconds = poll_seconds
+        self.verify_seconds = verify_seconds
+        self.chunksize = chunksize
+        self._snapshot = None
+        self._accumulator = None
+        self._rows = 0
+        self._last_id = 0
+        self._window = None
+        self._verified_at = 0.0
+        self._lock = threading.Lock()
+        self._resync_requested = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rows_fetched = 0
+        self.resyncs = 0
+
+    def snapshot(self):
+        """The latest published panels; None before the first load."""
+        return self._snapshot
+
+    def start(self):
+        if self._thread is None:
+            self.resync()
+            self._thread = threading.Thread(target=self._loop, name="live-tail", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def request_resync(self):
+        """Full re-read of the window on the next poll."""
+        self._resync_requested.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                # Keep serving the last panels; the next poll retries
+                snapshot = self._snapshot
+                if snapshot is not None:
+                    self._snapshot = LiveSnapshot(snapshot.panels, snapshot.since, snapshot.until, snapshot.rows,
+                                                  snapshot.last_id, snapshot.updated_at, snapshot.resynced_at,
+                                                  error=f"{type(e).__name__}: {e}")
+
+    def _read(self, conn, *conditions):
+        since, until = self._window
+        stmt = (
+            select(*[emails.c[c] for c in PROJECTED_COLUMNS])
+            .where(emails.c.timestamp.between(since, until), *conditions)
+        )
+        conn = conn.execution_options(stream_results=True, max_row_buffer=self.chunksize)
+        rows = 0
+        for chunk in pd.read_sql(stmt, conn, chunksize=self.chunksize):
+            self._accumulator.update(chunk)
+            rows += len(chunk)
+        self._rows += rows
+        self.rows_fetched += rows
+        return rows
+
+    def _window_rows(self, conn):
+        since, until = self._window
+        return conn.execute(
+            select(func.count()).select_from(emails)
+            .where(emails.c.timestamp.between(since, until), emails.c.id <= self._last_id)
+        ).scalar()
+
+    def _publish(self, resynced=False):
+        now = time.time()
+        previous = self._snapshot
+        since, until = self._window
+        self._snapshot = LiveSnapshot(
+            self._accumulator.panels(), since, until, self._rows, self._last_id, now,
+            now if resynced or previous is None else previous.resynced_at,
+        )
+
+    def resync(self):
+        """Re-read the whole window from scratch."""
+        with self._lock:
+            self._resync_requested.clear()
+            self._window = live_window(self.days)
+            self._accumulator = PanelAccumulator(window=self._window)
+            self._rows = 0
+            with self.engine.connect() as conn:
+                self._last_id = conn.execute(select(func.coalesce(func.max(emails.c.id), 0))).scalar()
+                self._read(conn, emails.c.id <= self._last_id)
+            self._verified_at = time.monotonic()
+            self.resyncs += 1
+            self._publish(resynced=True)
+        return self._snapshot
+
+    def poll(self):
+        """Fold rows with id above the watermark into the panels; returns the number of new rows."""
+        if self._resync_requested.is_set() or self._window is None or self._window != live_window(self.days):
+            self.resync()
+            return self._rows
+        with self._lock:
+            with self.engine.connect() as conn:
+                max_id = conn.execute(select(func.coalesce(func.max(emails.c.id), 0))).scalar()
+                stale = max_id < self._last_id
+                if not stale and time.monotonic() - self._verified_at >= self.verify_seconds:
+                    # Rows below the watermark can only go missing by being deleted
+                    stale = self._window_rows(conn) != self._rows
+                    self._verified_at = time.monotonic()
+                if not stale:
+                    new_rows = 0
+                    if max_id > self._last_id:
+                        new_rows = self._read(conn, emails.c.id > self._last_id, emails.c.id <= max_id)
+                        self._last_id = max_id
+                    if new_rows:
+                        self._publish()
+                    return new_rows
+        self.resync()
+        return self._rows
+
+
+# --- VERIFICATION ---
+
+def verify(num_rows=20_000, chunksize=1000, seed=11):
+    """
+    Tail a generated SQLite dataset while more rows are appended and some
+    are deleted, and check the live panels against the SQL panels of the
+    same window after every step.
+    """
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'live_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        generate_mock_data_fast(engine, num_rows=num_rows // 2, days=3, seed=seed)
+        tailer = LiveTailer(engine, days=2, verify_seconds=0, chunksize=chunksize)
+        tailer.resync()
+
+        def check(step, new_rows):
+            snapshot = tailer.snapshot()
+            bad = _mismatches(snapshot.panels, queries.load_panels(engine, snapshot.since, snapshot.until))
+            print(f"{step:<10} {new_rows:>7} rows read, {snapshot.rows:>7} in window, "
+                  f"{tailer.resyncs} resync(s): {'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+            return not bad
+
+        ok = check("initial", tailer.rows_fetched) and ok
+        generate_mock_data_fast(engine, num_rows=num_rows // 2, days=3, seed=seed + 1)
+        ok = check("append", tailer.poll()) and ok
+        ok = check("idle", tailer.poll()) and ok
+        with engine.begin() as conn:
+            conn.execute(delete(emails).where(emails.c.id % 10 == 0))
+        ok = check("delete", tailer.poll()) and ok
+        engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail the emails table into live dashboard panels.")
+    parser.add_argument("--check", action="store_true", help="verify against SQL panels on generated data")
+    parser.add_argument("--rows", type=int, default=20_000, help="mock rows for --check")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="trailing days to keep, today included")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, help="seconds between polls")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if verify(args.rows) else 1)
+
+    tailer = LiveTailer(partitions.install(create_engine(DB_URL)), days=args.days, poll_seconds=args.poll)
+    snapshot = tailer.resync()
+    try:
+        while True:
+            metrics = snapshot.panels['metrics'].iloc[0]
+            print(f"{datetime.datetime.now():%H:%M:%S} {snapshot.rows:,} emails since {snapshot.since:%Y-%m-%d}: "
+                  f"{int(metrics['total_sent']):,} sent, {int(metrics['total_replies']):,} replies, "
+                  f"{int(metrics['total_positive_leads']):,} leads")
+            time.sleep(args.poll)
+            tailer.poll()
+            snapshot = tailer.snapshot()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+import pandas as pd
+import numpy as np
+
+import instrumentation
+
+# --- DASHBOARD METRICS (no Streamlit, no database) ---
+# compute_panels(df) turns a raw email frame into every panel frame the
+# dashboard renders. The SQL, rollup and streaming sources produce the same
+# frames through the shaping helpers below.
+
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+SECONDS_PER_DAY = 24 * 3600
+
+# Dimensions that get a sent/replies/leads funnel on the dashboard
+FUNNEL_DIMENSIONS = ['contact_title', 'ai_agent', 'city', 'company_industry']
+# Panels finished from the dimension cube alone
+CUBE_PANELS = ['metrics', 'title_lead_rate', 'agent_lead_rate', 'city_funnel', 'industry_funnel']
+
+# Emails Over Time: points per direction the chart receives at most. The
+# finest bucket with at most TIMELINE_OVERSAMPLE x that many buckets in the
+# window is used, and series still over budget are thinned with LTTB.
+TIMELINE_MAX_POINTS = 200
+TIMELINE_OVERSAMPLE = 4
+# Resolution -> (approximate seconds per bucket, pandas period)
+TIMELINE_RESOLUTIONS = {
+    'hour': (3600, 'h'),
+    'day': (SECONDS_PER_DAY, 'D'),
+    'week': (7 * SECONDS_PER_DAY, 'W-SUN'),
+    'month': (30.44 * SECONDS_PER_DAY, 'M'),
+}
+
+
+# --- PANEL SHAPING ---
+# These turn small aggregate frames into the frames the dashboard renders.
+# Every data source (SQL, rollup, streaming, in-memory) ends here.
+
+def metrics_frame(total_emails, total_sent, total_replies, total_leads, avg_reply_seconds):
+    return pd.DataFrame([{
+        'total_emails': int(total_emails),
+        'total_sent': int(total_sent),
+        'total_replies': int(total_replies),
+        'total_positive_leads': int(total_leads),
+        'avg_reply_time_seconds': float(avg_reply_seconds) if pd.notna(avg_reply_seconds) else np.nan,
+    }])
+
+
+def timeline_resolution(start_dt, end_dt, max_points=None):
+    """The finest of hour/day/week/month that keeps the window within the point budget (oversampled)."""
+    limit = (max_points or TIMELINE_MAX_POINTS) * TIMELINE_OVERSAMPLE
+    span = max((pd.Timestamp(end_dt) - pd.Timestamp(start_dt)).total_seconds(), 1)
+    for resolution, (seconds, _) in TIMELINE_RESOLUTIONS.items():
+        if span / seconds <= limit:
+            return resolution
+    return 'month'
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indexes of `threshold` points of (x, y)
+    that keep the visual shape of the line, first and last point included.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, threshold - 1).astype('int64')
+    keep = np.empty(threshold, dtype='int64')
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[previous] - avg_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (avg_y - y[previous]))
+        previous = lo + int(np.argmax(area))
+        keep[i + 1] = previous
+    return keep
+
+
+def _bucket_starts(counts):
+    if 'year' in counts:
+        return pd.to_datetime(pd.DataFrame({'year': counts['year'].astype(int),
+                                            'month': counts['month'].astype(int), 'day': 1}))
+    starts = pd.to_datetime(counts['day'])
+    if 'hour' in counts:
+        starts = starts + pd.to_timedelta(counts['hour'].astype(float).fillna(0), unit='h')
+    return starts
+
+
+def timeline_frame(counts, resolution, max_points=None):
+    """
+    Expects columns direction, count and the bucket as day (plus hour) or
+    year and month. Returns one row per `resolution` bucket and direction
+    (zero-filled between the first and last bucket) in the long format used
+    by the line chart, each series thinned to max_points with LTTB.
+    """
+    if counts.empty:
+        return pd.DataFrame(columns=['timestamp', 'direction', 'count'])
+    period = TIMELINE_RESOLUTIONS[resolution][1]
+    buckets = _bucket_starts(counts).dt.to_period(period).dt.start_time
+    wide = (
+        counts.assign(timestamp=buckets.values)
+        .pivot_table(index='timestamp', columns='direction', values='count', aggfunc='sum', fill_value=0)
+        .reindex(columns=['sent', 'received'], fill_value=0)
+    )
+    full = pd.period_range(wide.index.min(), wide.index.max(), freq=period).start_time
+    wide = wide.reindex(full, fill_value=0).astype('int64')
+    wide.index.name = 'timestamp'
+    wide.columns.name = None
+    frame = wide.reset_index().melt(id_vars='timestamp', var_name='direction', value_name='count')
+    max_points = max_points or TIMELINE_MAX_POINTS
+    if len(wide) <= max_points:
+        return frame
+    x = wide.index.asi8
+    return pd.concat([
+        series.iloc[lttb(x, series['count'].to_numpy(), max_points)]
+        for _, series in frame.groupby('direction', sort=False)
+    ], ignore_index=True)
+
+
+def sentiment_frame(sentiment_counts):
+    df = sentiment_counts[sentiment_counts['count'] > 0]
+    df = pd.DataFrame({
+        'reply_sentiment': df['reply_sentiment'].astype(object).values,
+        'Count': df['count'].astype(int).values,
+    })
+    return df.sort_values('reply_sentiment').reset_index(drop=True)
+
+
+def lead_rate_frame(dim_counts, dim):
+    """
+    Expects columns <dim>, sent, leads. Only values that were actually sent to
+    are kept, matching a left join from the sent counts.
+    """
+    df = dim_counts[dim_counts[dim].notna() & (dim_counts['sent'] > 0)]
+    df = pd.DataFrame({
+        dim: df[dim].astype(object).values,
+        'Total Sent': df['sent'].astype(int).values,
+        'Total Leads': df['leads'].astype(int).values,
+    })
+    df['Lead Rate (%)'] = (df['Total Leads'] / df['Total Sent']) * 100
+    return df.sort_values(['Lead Rate (%)', dim], ascending=[False, True]).reset_index(drop=True)
+
+
+def funnel_frame(dim_counts, dim):
+    """Expects columns <dim>, sent, replies, leads."""
+    df = dim_counts[dim_counts[dim].notna() & (dim_counts['sent'] > 0)]
+    df = pd.DataFrame({
+        dim: df[dim].astype(object).values,
+        'Total Sent': df['sent'].astype(int).values,
+        'Total Replies': df['replies'].astype(int).values,
+        'Total Positive Leads': df['leads'].astype(int).values,
+    })
+    df['Reply Rate (%)'] = (df['Total Replies'] / df['Total Sent']) * 100
+    df['Lead Rate (%)'] = (df['Total Positive Leads'] / df['Total Sent']) * 100
+    return df.sort_values(['Lead Rate (%)', dim], ascending=[False, True]).reset_index(drop=True)
+
+
+def weekday_frame(day_hour_counts):
+    """Expects columns day, hour, count (replies)."""
+    weekdays = pd.to_datetime(day_hour_counts['day']).dt.day_name()
+    replies = day_hour_counts.groupby(weekdays.values)['count'].sum()
+    replies = replies.reindex(DAY_ORDER, fill_value=0).astype(int)
+    return pd.DataFrame({'Day of Week': DAY_ORDER, 'Replies': replies.values})
+
+
+def hourly_frame(day_hour_counts):
+    """Expects columns day, hour, count (replies)."""
+    hourly = day_hour_counts.groupby('hour')['count'].sum().astype(int)
+    return pd.DataFrame({'Hour': hourly.index.astype(int), 'Replies': hourly.values})
+
+
+def reply_time_histogram_frame(reply_day_counts):
+    """
+    Expects columns reply_day (ceil of the reply delay in days) and count.
+    Buckets run from day 1 to the largest observed day, like np.histogram
+    over np.arange(1, max_days + 2).
+    """
+    counts = reply_day_counts.dropna(subset=['reply_day'])
+    if counts.empty:
+        return pd.DataFrame(columns=['Reply Day', 'Reply_Day_Num', 'Count',
+                                     'Cumulative Count', 'Cumulative Percentage (%)'])
+    counts = counts.groupby(counts['reply_day'].astype(int))['count'].sum()
+    days = np.arange(1, int(counts.index.max()) + 1)
+    hist = counts.reindex(days, fill_value=0).astype(int).values
+    dist = pd.DataFrame({
+        'Reply Day': [f'Day {d}' for d in days],
+        'Reply_Day_Num': days,
+        'Count': hist,
+    })
+    dist['Cumulative Count'] = dist['Count'].cumsum()
+    total_count = dist['Count'].sum()
+    dist['Cumulative Percentage (%)'] = (dist['Cumulative Count'] / total_count) * 100 if total_count else 0.0
+    return dist
+
+
+def top_companies_frame(company_counts, limit=10):
+    df = company_counts.rename(columns={'count': 'Positive Replies'})[['company_name', 'Positive Replies']]
+    df = df.sort_values(['Positive Replies', 'company_name'], ascending=[False, True], kind='stable')
+    return df.head(limit).reset_index(drop=True)
+
+
+# --- SINGLE-PASS AGGREGATION OVER RAW ROWS ---
+
+def _counts(series, names):
+    if series is None or series.empty:
+        return pd.DataFrame(columns=names + ['count'])
+    return series.astype('int64').rename_axis(names).reset_index(name='count')
+
+
+def _codes(values):
+    """
+    Integer codes for a column, 0 meaning missing, plus the label of every
+    code. Categorical columns reuse their category codes; anything else is
+    factorized once.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy().astype('int64')
+        labels = np.asarray(values.cat.categories, dtype=object)
+    else:
+        codes, labels = pd.factorize(values)
+        labels = np.asarray(labels, dtype=object)
+    return codes + 1, np.concatenate([[np.nan], labels])
+
+
+def _day_codes(timestamps):
+    days = timestamps.to_numpy().astype('datetime64[D]')
+    valid = ~np.isnat(days)
+    if not valid.any():
+        return np.zeros(len(days), dtype='int64'), np.array([pd.NaT], dtype=object)
+    day_numbers = days.astype('int64')
+    first, last = day_numbers[valid].min(), day_numbers[valid].max()
+    codes = np.where(valid, day_numbers - first + 1, 0)
+    labels = pd.to_datetime(np.arange(first, last + 1), unit='D')
+    return codes, np.concatenate([[pd.NaT], np.asarray(labels, dtype=object)])
+
+
+def _group_sums(keys, measures):
+    """
+    Sum every measure per combination of key codes with one np.bincount per
+    measure. keys is a list of (name, codes, labels); combinations where the
+    first measure is zero are left out. Returns a frame indexed by labels.
+    """
+    names = [name for name, _, _ in keys]
+    sizes = [len(labels) for _, _, labels in keys]
+    flat = np.ravel_multi_index([codes for _, codes, _ in keys], sizes)
+    slots = None
+    num_slots = int(np.prod(sizes))
+    if num_slots > 4 * len(flat) + 1024:
+        # Sparse key space (high-cardinality dimensions): compact it first
+        flat, slots = pd.factorize(flat)
+        num_slots = len(slots)
+    sums = {name: np.bincount(flat, weights=values, minlength=num_slots) for name, values in measures.items()}
+    present = np.flatnonzero(next(iter(sums.values())))
+    combos = slots[present] if slots is not None else present
+    level_codes = np.unravel_index(combos, sizes)
+    index = pd.MultiIndex.from_arrays(
+        [labels[codes] for (_, _, labels), codes in zip(keys, level_codes)], names=names
+    ) if len(keys) > 1 else pd.Index(keys[0][2][level_codes[0]], name=names[0])
+    return pd.DataFrame({name: values[present].astype('int64') for name, values in sums.items()}, index=index)
+
+
+def _row_measures(df):
+    # Per-row sums of the dimension cube, plus the reply-time seconds
+    is_sent = (df['direction'] == 'sent').to_numpy(dtype=bool)
+    is_reply = ((df['direction'] == 'received') & (df['is_reply'] == True)).to_numpy(dtype=bool)
+    is_lead = is_reply & (df['reply_sentiment'] == 'positive').to_numpy(dtype=bool)
+    seconds = pd.to_numeric(df['reply_time_delta_seconds']).astype('float64').to_numpy()
+    has_reply_time = is_reply & ~np.isnan(seconds)
+    return {
+        'emails': np.ones(len(df)),
+        'sent': is_sent,
+        'replies': is_reply,
+        'leads': is_lead,
+        'reply_time_sum': np.where(has_reply_time, seconds, 0),
+        'reply_time_count': has_reply_time,
+    }, seconds
+
+
+def dimension_cube(df, keys=()):
+    """
+    Cube measures (emails, sent, replies, leads, reply-time sum and count)
+    per title x agent x city x industry, after any leading (name, codes,
+    labels) keys. CUBE_PANELS are finished from it by cube_panels().
+    """
+    measures, _ = _row_measures(df)
+    return _group_sums(list(keys) + [(dim, *_codes(df[dim])) for dim in FUNNEL_DIMENSIONS], measures)
+
+
+def aggregate(df):
+    """
+    One vectorized pass over raw email rows. Every dimension is turned into
+    integer codes once, and each panel is a bincount over those codes. The
+    four dimension funnels and the top-level metrics share one cube
+    (title x agent x city x industry). The result is a dict of small
+    partial aggregates that can be merged across chunks with merge().
+    """
+    timestamps = pd.to_datetime(df['timestamp'])
+    measures, seconds = _row_measures(df)
+    is_reply, is_lead = measures['replies'], measures['leads']
+    cube = _group_sums([(dim, *_codes(df[dim])) for dim in FUNNEL_DIMENSIONS], measures)
+    day = ('day', *_day_codes(timestamps))
+    hours = timestamps.dt.hour.to_numpy()
+    hour = ('hour', np.nan_to_num(hours, nan=-1).astype('int64') + 1, np.concatenate([[np.nan], np.arange(24)]))
+
+    lead_seconds = seconds[is_lead]
+    lead_days = np.ceil(lead_seconds[~np.isnan(lead_seconds)] / SECONDS_PER_DAY)
+    leads = df[is_lead]
+    return {
+        'cube': cube,
+        'timeline': _group_sums([day, hour, ('direction', *_codes(df['direction']))],
+                                {'count': np.ones(len(df))})['count'],
+        'sentiment': _group_sums([('reply_sentiment', *_codes(df['reply_sentiment']))], {'count': is_reply})['count'],
+        'day_hour': _group_sums([day, hour], {'count': is_reply})['count'],
+        'reply_days': pd.Series(lead_days).value_counts(sort=False),
+        'companies': leads.groupby('company_name', observed=True).size(),
+    }
+
+
+def merge(left, right):
+    """Add two aggregate() results (either may be None)."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return {key: left[key].add(right[key], fill_value=0) for key in left}
+
+
+def _cube_builders(cube):
+    totals = cube.sum()
+
+    def dimension_counts(dim):
+        counts = cube.groupby(level=dim, observed=True)[['sent', 'replies', 'leads']].sum().astype('int64')
+        return counts.rename_axis(dim).reset_index()
+
+    def top_metrics():
+        avg_reply = totals['reply_time_sum'] / totals['reply_time_count'] if totals['reply_time_count'] else np.nan
+        return metrics_frame(totals['emails'], totals['sent'], totals['replies'], totals['leads'], avg_reply)
+
+    return {
+        'metrics': top_metrics,
+        'title_lead_rate': lambda: lead_rate_frame(dimension_counts('contact_title'), 'contact_title'),
+        'agent_lead_rate': lambda: lead_rate_frame(dimension_counts('ai_agent'), 'ai_agent'),
+        'city_funnel': lambda: funnel_frame(dimension_counts('city'), 'city'),
+        'industry_funnel': lambda: funnel_frame(dimension_counts('company_industry'), 'company_industry'),
+    }
+
+
+def cube_panels(cube, panels=None):
+    """The CUBE_PANELS (or the named ones of them) of a dimension_cube()."""
+    builders = _cube_builders(cube)
+    return {name: builders[name]() for name in (panels or CUBE_PANELS)}
+
+
+def finish(aggregates, panels=None, window=None):
+    """
+    Turn aggregate()/merge() output into the dashboard's panel frames.
+    panels limits the result to those panel names (default: all). window
+    (start_dt, end_dt) picks the Emails Over Time resolution; without it
+    the span of the data does.
+    """
+    cube_builders = _cube_builders(aggregates['cube'])
+
+    def day_hour():
+        return _counts(aggregates['day_hour'], ['day', 'hour'])
+
+    def timeline():
+        counts = _counts(aggregates['timeline'], ['day', 'hour', 'direction'])
+        if counts.empty:
+            return timeline_frame(counts, 'day')
+        first, last = window or (counts['day'].min(), counts['day'].max() + pd.Timedelta(days=1))
+        return timeline_frame(counts, timeline_resolution(first, last))
+
+    builders = {
+        'metrics': cube_builders['metrics'],
+        'daily': timeline,
+        'sentiment': lambda: sentiment_frame(_counts(aggregates['sentiment'], ['reply_sentiment'])),
+        'title_lead_rate': cube_builders['title_lead_rate'],
+        'agent_lead_rate': cube_builders['agent_lead_rate'],
+        'weekday': lambda: weekday_frame(day_hour()),
+        'hourly': lambda: hourly_frame(day_hour()),
+        'reply_time_hist': lambda: reply_time_histogram_frame(_counts(aggregates['reply_days'], ['reply_day'])),
+        'top_companies': lambda: top_companies_frame(_counts(aggregates['companies'], ['company_name'])),
+        'city_funnel': cube_builders['city_funnel'],
+        'industry_funnel': cube_builders['industry_funnel'],
+    }
+    results = {}
+    for name in (panels or builders):
+        with instrumentation.span(f"panel.{name}", "compute") as s:
+            results[name] = builders[name]()
+            s.result(results[name])
+    return results
+
+
+def compute_panels(df, window=None):
+    """All dashboard panels from one raw email frame (window: see finish)."""
+    with instrumentation.span("aggregate", "compute"):
+        aggregates = aggregate(df)
+    return finish(aggregates, window=window)
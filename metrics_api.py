@@ -0,0 +1,432 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select
+
+import metrics
+import partitions
+import queries
+import result_cache
+import rollup
+import sketches
+from frame_schema import PROJECTED_COLUMNS, compact_frame, concat_frames
+from mock_db import Base, Email, DB_URL, generate_mock_data_fast
+from streaming import DEFAULT_CHUNKSIZE, iter_window_chunks
+
+# --- HEADLESS METRICS API ---
+# The dashboard's numbers as JSON, for many date ranges at once: top-level
+# metrics, reply/lead rates per dimension, replies by weekday and hour and
+# reply-time stats. A batch makes one shared read of the union of its
+# ranges' days, either a scan of the emails rows ('scan') or the daily
+# rollup plus the reply-time sketches ('rollup'), and reduces it to per-day
+# aggregates. The scan folds the rows in chunks, so its memory is bounded by
+# the per-day aggregates, not by the number of rows. Every range is then a
+# sum over its days, shaped by the same metrics.py helpers as the dashboard
+# panels. Ranges are whole days. Answers are cached per range in a
+# result_cache.ResultCache, so repeated requests do not reach the database.
+
+SOURCES = ['scan', 'rollup']
+DIMENSIONS = metrics.FUNNEL_DIMENSIONS
+DIMENSION_ALIASES = {'title': 'contact_title', 'agent': 'ai_agent', 'industry': 'company_industry'}
+QUANTILES = (0.5, 0.9, 0.99)
+MEASURES = ['emails', 'sent', 'replies', 'leads', 'reply_time_sum', 'reply_time_count']
+RATE_COLUMNS = {'Total Sent': 'sent', 'Total Replies': 'replies', 'Total Positive Leads': 'leads',
+                'Reply Rate (%)': 'reply_rate_pct', 'Lead Rate (%)': 'lead_rate_pct'}
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+emails = Email.__table__
+
+
+def parse_range(text):
+    """'2024-05-01:2024-05-31' (or a single day) -> (start date, end date)."""
+    start, _, end = text.partition(':')
+    start = datetime.date.fromisoformat(start)
+    end = datetime.date.fromisoformat(end) if end else start
+    if start > end:
+        raise ValueError(f"range {text!r} ends before it starts")
+    return start, end
+
+
+def last_days(days, today=None):
+    today = today or datetime.date.today()
+    return today - datetime.timedelta(days=days - 1), today
+
+
+def parse_dimensions(names):
+    dims = [DIMENSION_ALIASES.get(name, name) for name in (names or DIMENSIONS)]
+    unknown = sorted(set(dims) - set(DIMENSIONS))
+    if unknown:
+        raise ValueError(f"unknown dimension(s) {', '.join(unknown)}; expected {', '.join(DIMENSIONS)}")
+    return dims
+
+
+def _bounds(ranges):
+    start = min(s for s, _ in ranges)
+    end = max(e for _, e in ranges)
+    return (datetime.datetime.combine(start, datetime.time.min), datetime.datetime.combine(end, datetime.time.max))
+
+
+def _day_runs(ranges):
+    """The union of the ranges' days as disjoint (start date, end date) runs, in order."""
+    runs = []
+    for start, end in sorted(ranges):
+        if runs and start <= runs[-1][1] + datetime.timedelta(days=1):
+            runs[-1] = (runs[-1][0], max(runs[-1][1], end))
+        else:
+            runs.append((start, end))
+    return runs
+
+
+# --- SHARED READ: PER-DAY AGGREGATES ---
+# cube: day x FUNNEL_DIMENSIONS with MEASURES; day_hour: day, hour, count
+# (replies); buckets: day, bucket, count (reply-time sketch of all replies)
+
+def _chunk_days(df):
+    day = df['timestamp'].dt.normalize()
+    is_sent = df['direction'] == 'sent'
+    is_reply = (df['direction'] == 'received') & (df['is_reply'] == True)
+    is_lead = is_reply & (df['reply_sentiment'] == 'positive')
+    seconds = pd.to_numeric(df['reply_time_delta_seconds']).astype('float64')
+    has_time = is_reply & seconds.notna()
+    cube = (
+        pd.DataFrame({
+            'day': day, **{dim: df[dim] for dim in DIMENSIONS},
+            'emails': 1, 'sent': is_sent.astype('int64'), 'replies': is_reply.astype('int64'),
+            'leads': is_lead.astype('int64'), 'reply_time_sum': seconds.where(has_time, 0),
+            'reply_time_count': has_time.astype('int64'),
+        })
+        .groupby(['day'] + DIMENSIONS, observed=True, dropna=False)[MEASURES].sum().reset_index()
+    )
+    day_hour = (
+        pd.DataFrame({'day': day[is_reply], 'hour': df['timestamp'][is_reply].dt.hour})
+        .groupby(['day', 'hour']).size().reset_index(name='count')
+    )
+    buckets = (
+        pd.DataFrame({'day': day[has_time], 'bucket': sketches.bucket_index(seconds[has_time])})
+        .groupby(['day', 'bucket']).size().reset_index(name='count')
+    )
+    return cube, day_hour, buckets
+
+
+def _merge_days(left, right):
+    if left is None:
+        return right
+    cube, day_hour, buckets = (concat_frames([a, b]) for a, b in zip(left, right))
+    return (
+        cube.groupby(['day'] + DIMENSIONS, observed=True, dropna=False)[MEASURES].sum().reset_index(),
+        day_hour.groupby(['day', 'hour'])['count'].sum().reset_index(),
+        buckets.groupby(['day', 'bucket'])['count'].sum().reset_index(),
+    )
+
+
+def _scan_days(conn, start_dt, end_dt, chunksize=DEFAULT_CHUNKSIZE):
+    days = None
+    for chunk in iter_window_chunks(conn, start_dt, end_dt, chunksize=chunksize):
+        days = _merge_days(days, _chunk_days(compact_frame(chunk)))
+    return days if days is not None else _chunk_days(compact_frame(pd.DataFrame(columns=PROJECTED_COLUMNS)))
+
+
+def _rollup_days(conn, start_dt, end_dt, chunksize=None):
+    r = pd.read_sql(
+        select(*[rollup.rollup.c[c] for c in rollup.ROLLUP_KEYS + rollup.ROLLUP_MEASURES])
+        .where(rollup.in_window(start_dt, end_dt)),
+        conn,
+    )
+    is_reply = (r['direction'] == 'received') & (r['is_reply'] == True)
+    count = r['email_count']
+    cube = (
+        pd.DataFrame({
+            'day': pd.to_datetime(r['day']), **{dim: r[dim] for dim in DIMENSIONS},
+            'emails': count, 'sent': count.where(r['direction'] == 'sent', 0),
+            'replies': count.where(is_reply, 0), 'leads': count.where(is_reply & (r['reply_sentiment'] == 'positive'), 0),
+            'reply_time_sum': r['reply_time_sum'].where(is_reply, 0),
+            'reply_time_count': r['reply_time_count'].where(is_reply, 0),
+        })
+        .groupby(['day'] + DIMENSIONS, dropna=False)[MEASURES].sum().reset_index()
+    )
+    # The rollup has no hour; this is one small GROUP BY day, hour for the whole batch
+    day_hour = queries.query_reply_day_hour(conn, start_dt, end_dt)
+    day_hour['day'] = pd.to_datetime(day_hour['day'])
+    sketch = sketches.reply_sketch
+    buckets = pd.read_sql(
+        select(sketch.c.day, sketch.c.bucket, sketch.c['count'])
+        .where(sketch.c.dimension == 'all', sketch.c.day.between(start_dt.date(), end_dt.date())),
+        conn,
+    )
+    buckets['day'] = pd.to_datetime(buckets['day'])
+    return cube, day_hour, buckets
+
+
+def read_days(engine, ranges, source='scan', chunksize=DEFAULT_CHUNKSIZE):
+    """Per-day aggregates of the union of the ranges' days, one read per run of consecutive days."""
+    if source == 'rollup':
+        rollup.update_rollup(engine)
+        sketches.update_reply_time_sketches(engine)
+        reader = _rollup_days
+    elif source == 'scan':
+        reader = _scan_days
+    else:
+        raise ValueError(f"unknown source {source!r}; expected one of {', '.join(SOURCES)}")
+    parts = []
+    with engine.connect() as conn:
+        for run in _day_runs(ranges):
+            parts.append(reader(conn, *_bounds([run]), chunksize=chunksize))
+    # The runs are disjoint, so their days only need stacking
+    return tuple(concat_frames(frames) for frames in zip(*parts))
+
+
+# --- PER-RANGE REPORT ---
+
+def _number(value):
+    # JSON has no NaN
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _records(df):
+    return [{k: _number(v) for k, v in row.items()} for row in df.to_dict('records')]
+
+
+def range_report(days, start, end, dims):
+    """The JSON-ready report of one range, from read_days() output covering it."""
+    cube, day_hour, buckets = days
+    first, last = pd.Timestamp(start), pd.Timestamp(end)
+    cube = cube[cube['day'].between(first, last)]
+    day_hour = day_hour[day_hour['day'].between(first, last)]
+    buckets = buckets[buckets['day'].between(first, last)].groupby('bucket')['count'].sum()
+
+    totals = cube[MEASURES].sum()
+    mean = totals['reply_time_sum'] / totals['reply_time_count'] if totals['reply_time_count'] else np.nan
+    top = metrics.metrics_frame(totals['emails'], totals['sent'], totals['replies'], totals['leads'], mean)
+    estimates = sketches.sketch_quantiles(buckets.index.to_numpy(), buckets.to_numpy(), QUANTILES)
+
+    rates = {}
+    for dim in dims:
+        counts = cube.groupby(dim, dropna=False)[['sent', 'replies', 'leads']].sum().reset_index()
+        rates[dim] = _records(metrics.funnel_frame(counts, dim).rename(columns={dim: 'value', **RATE_COLUMNS}))
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'metrics': _records(top)[0],
+        'rates': rates,
+        'weekday': _records(metrics.weekday_frame(day_hour).rename(columns={'Day of Week': 'day', 'Replies': 'replies'})),
+        'hourly': _records(metrics.hourly_frame(day_hour).rename(columns={'Hour': 'hour', 'Replies': 'replies'})),
+        'reply_time': {
+            'replies': int(buckets.sum()),
+            'mean_seconds': _number(float(mean)),
+            # Within 1% of the exact quantile (see sketches.py)
+            **{f"p{q * 100:g}_seconds": _number(float(v)) for q, v in zip(QUANTILES, estimates)},
+        },
+    }
+
+
+def batch_report(engine, ranges, dims=None, source='scan', cache=None, cache_prefix=None,
+                 chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Reports for every (start date, end date) in ranges, in order. Cached
+    ranges come from `cache`; the rest share one read_days() of their days.
+    """
+    dims = parse_dimensions(dims)
+    keys = [result_cache.make_key('metrics_api', cache_prefix, source, s, e, dims) for s, e in ranges]
+    reports = [cache.get(key) if cache is not None else None for key in keys]
+    missing = [i for i, report in enumerate(reports) if report is None]
+    if missing:
+        days = read_days(engine, [ranges[i] for i in missing], source=source, chunksize=chunksize)
+        for i in missing:
+            reports[i] = range_report(days, *ranges[i], dims)
+            if cache is not None:
+                cache.put(keys[i], reports[i])
+    return reports
+
+
+# --- HTTP SERVER ---
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    GET  /metrics?range=2024-05-01:2024-05-31&range=...&dimension=ai_agent&source=rollup
+    GET  /metrics?last=7&last=30
+    POST /metrics  {"ranges": ["2024-05-01:2024-05-31", ...], "dimensions": [...], "source": "scan"}
+    GET  /health
+    """
+    server_version = "EmailMetricsAPI/1.0"
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _answer(self, ranges, dims, source):
+        try:
+            if not ranges:
+                raise ValueError("no ranges given")
+            ranges = [parse_range(r) for r in ranges]
+            dims = parse_dimensions(dims)
+            source = source or self.server.default_source
+            if source not in SOURCES:
+                raise ValueError(f"unknown source {source!r}")
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        try:
+            started = time.perf_counter()
+            results = batch_report(self.server.engine, ranges, dims, source, self.server.cache, self.server.cache_prefix)
+        except Exception as e:
+            return self._send(500, {'error': f"{type(e).__name__}: {e}"})
+        self._send(200, {'source': source, 'seconds': time.perf_counter() - started, 'results': results})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send(200, {'status': 'ok'})
+        if url.path != "/metrics":
+            return self._send(404, {'error': f"unknown path {url.path}"})
+        params = parse_qs(url.query)
+        ranges = params.get('range', []) + [
+            ':'.join(d.isoformat() for d in last_days(int(n))) for n in params.get('last', []) if n.isdigit()
+        ]
+        self._answer(ranges, params.get('dimension'), params.get('source', [None])[0])
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/metrics":
+            return self._send(404, {'error': f"unknown path {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            return self._send(400, {'error': "body is not JSON"})
+        if not isinstance(body, dict):
+            return self._send(400, {'error': "body is not a JSON object"})
+        self._answer(body.get('ranges', []), body.get('dimensions'), body.get('source'))
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def serve(engine, host=DEFAULT_HOST, port=DEFAULT_PORT, source='scan', cache=None, cache_prefix=None, quiet=False):
+    """A ThreadingHTTPServer answering MetricsHandler requests; call serve_forever() on it."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.engine = engine
+    server.default_source = source
+    server.cache = cache
+    server.cache_prefix = cache_prefix
+    server.quiet = quiet
+    return server
+
+
+# --- VERIFICATION ---
+
+def _same(left, right):
+    if isinstance(left, dict):
+        return isinstance(right, dict) and left.keys() == right.keys() and all(_same(left[k], right[k]) for k in left)
+    if isinstance(left, list):
+        return isinstance(right, list) and len(left) == len(right) and all(map(_same, left, right))
+    if isinstance(left, float) and isinstance(right, (int, float)):
+        return math.isclose(left, right)
+    return left == right
+
+
+def verify(num_rows=50_000, seed=5):
+    """
+    Answer several ranges in one batch from each source on a generated
+    SQLite dataset and compare them with the dashboard's SQL panels.
+    """
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'api_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        generate_mock_data_fast(engine, num_rows=num_rows, seed=seed)
+        ranges = [last_days(n) for n in (1, 7, 30, 90)] + [(last_days(30)[0], last_days(8)[1])]
+        # Plus two short ranges far apart, read as separate runs of days
+        today = datetime.date.today()
+        ranges += [(today - datetime.timedelta(days=85), today - datetime.timedelta(days=80)),
+                   (today - datetime.timedelta(days=12), today - datetime.timedelta(days=10))]
+        for source in SOURCES:
+            reports = batch_report(engine, ranges[-2:], source=source, chunksize=2000)
+            reports = batch_report(engine, ranges[:-2], source=source, chunksize=2000) + reports
+            for (start, end), report in zip(ranges, reports):
+                start_dt, end_dt = _bounds([(start, end)])
+                panels = queries.load_panels(engine, start_dt, end_dt)
+                bad = [] if _same(_records(panels['metrics'])[0], report['metrics']) else ['metrics']
+                for dim in DIMENSIONS:
+                    with engine.connect() as conn:
+                        counts = queries.query_dimension_counts(conn, start_dt, end_dt, dim)
+                    expected = metrics.funnel_frame(counts, dim).rename(columns={dim: 'value', **RATE_COLUMNS})
+                    if not _same(_records(expected), report['rates'][dim]):
+                        bad.append(dim)
+                for name in ('weekday', 'hourly'):
+                    if [r['replies'] for r in report[name]] != list(panels[name]['Replies']):
+                        bad.append(name)
+                ok = ok and not bad
+                print(f"{source:<7} {start} .. {end}: {'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+        engine.dispose()
+    return ok
+
+
+def _cache(kind, path):
+    return None if kind == "off" else result_cache.open_cache(kind, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard metrics as JSON: a batch report CLI and an HTTP server.")
+    parser.add_argument("command", choices=["report", "serve", "check"])
+    parser.add_argument("--range", dest="ranges", action="append", default=[],
+                        help="START:END dates (inclusive), repeatable")
+    parser.add_argument("--last", type=int, nargs="+", default=[], help="ranges of the last N days, e.g. --last 7 30")
+    parser.add_argument("--dimensions", nargs="+", help=f"rate dimensions (default: all of {', '.join(DIMENSIONS)})")
+    parser.add_argument("--source", choices=SOURCES, default="scan",
+                        help="one scan of the emails rows, or the daily rollup and sketches")
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    parser.add_argument("--cache", choices=["off"] + list(result_cache.BACKENDS), default="sqlite",
+                        help="per-range response cache (shared with the dashboard's result cache)")
+    parser.add_argument("--cache-path")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.command == "check":
+        raise SystemExit(0 if verify() else 1)
+
+    engine = partitions.install(create_engine(DB_URL))
+    cache = _cache(args.cache, args.cache_path)
+    if args.command == "serve":
+        server = serve(engine, args.host, args.port, source=args.source, cache=cache, cache_prefix=DB_URL)
+        print(f"Serving metrics on http://{args.host}:{args.port}/metrics")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        return
+
+    try:
+        ranges = [parse_range(r) for r in args.ranges] + [last_days(n) for n in args.last]
+        dims = parse_dimensions(args.dimensions)
+    except ValueError as e:
+        parser.error(str(e))
+    if not ranges:
+        parser.error("give at least one --range or --last")
+    results = batch_report(engine, ranges, dims, args.source, cache, cache_prefix=DB_URL)
+    text = json.dumps({'source': args.source, 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {len(results)} range(s) to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
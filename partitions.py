@@ -0,0 +1,556 @@
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import re
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from sqlalchemy import (
+    create_engine, event, inspect, select, delete, func, text, Column, Index, MetaData, Table,
+)
+from sqlalchemy.sql import Select, operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BooleanClauseList, Grouping
+from sqlalchemy.sql.selectable import Alias
+
+import cohorts
+import queries
+import snapshot
+from frame_schema import PROJECTED_COLUMNS
+from indexes import DASHBOARD_INDEXES
+from mock_db import Base, Email, DB_URL, existing_columns, generate_mock_data_fast
+from streaming import DEFAULT_CHUNKSIZE, PanelAccumulator, iter_window_chunks, _mismatches
+
+emails = Email.__table__
+
+DEFAULT_ARCHIVE_DIR = "archive/emails"
+DEFAULT_RETENTION_MONTHS = 12   # months kept in the database, current month included
+DEFAULT_HOT_MONTHS = 1          # SQLite: months left in the emails table itself
+DEFAULT_MONTHS_AHEAD = 3        # MySQL: empty partitions kept ready after the current month
+SHARD_PATTERN = re.compile(r'^emails_p(\d{4})(\d{2})$')
+ARCHIVE_PARTITIONING = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+# --- TIME-PARTITIONED EMAILS STORAGE ---
+# MySQL: emails is RANGE-partitioned on TO_DAYS(timestamp), one partition per
+# month (pYYYYMM) plus pmax. The optimizer prunes partitions for every
+# timestamp-range query, so queries need no change.
+#
+# SQLite: emails stays the table every writer uses and holds the recent
+# (hot) months. seal_months() moves whole older months into shard tables
+# emails_pYYYYMM with the same columns and indexes; the emails_all view is
+# their UNION ALL. install(engine) routes reads: a SELECT whose WHERE has a
+# top-level emails.timestamp window (BETWEEN a AND b, or a lower and an
+# upper bound) gets a WITH emails AS (...) over the hot table plus only the
+# shards overlapping the window (and, for statements that join emails to
+# itself, the later shards too, where replies land). A SELECT bounding
+# emails.id from below (the id watermark folds, snapshot exports) gets the
+# shards holding ids above the bound, so a fold from watermark 0 sees every
+# row. The row with the highest id always stays in the hot table, so
+# max(id) and SQLite's next id need no routing. Other statements and all
+# writes see the hot table only.
+#
+# Retention: archive_months() writes every month older than the retention
+# period to <archive>/month=YYYY-MM/part.parquet (zstd) and drops it from
+# the database. read_archive() and stream_panels() read archived months
+# back on demand.
+
+
+def month_start(value):
+    value = pd.Timestamp(value)
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+    year, index = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return datetime.date(year, index + 1, 1)
+
+
+def months_between(first, last):
+    months = []
+    month = month_start(first)
+    while month <= month_start(last):
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _month_bounds(month):
+    return (datetime.datetime.combine(month, datetime.time.min),
+            datetime.datetime.combine(add_months(month, 1), datetime.time.min))
+
+
+def _in_month(table, month):
+    first, after = _month_bounds(month)
+    return (table.c.timestamp >= first) & (table.c.timestamp < after)
+
+
+# --- SQLITE SHARDS ---
+
+def shard_name(month):
+    return f"emails_p{month:%Y%m}"
+
+
+def shard_table(month):
+    """The shard of `month`: emails' columns and dashboard indexes under their own names."""
+    name = shard_name(month)
+    table = Table(name, MetaData(), *[
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in emails.columns
+    ])
+    for index in DASHBOARD_INDEXES:
+        Index(index.name.replace('ix_emails', f'ix_{name}', 1), *[table.c[c.name] for c in index.columns])
+    return table
+
+
+def sqlite_shards(conn):
+    """{month: shard table name} of the sealed months."""
+    shards = {}
+    for name in inspect(conn).get_table_names():
+        match = SHARD_PATTERN.match(name)
+        if match:
+            shards[datetime.date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return shards
+
+
+def _union(names, prefix="main."):
+    columns = ", ".join(c.name for c in emails.columns)
+    return " UNION ALL ".join(f"SELECT {columns} FROM {prefix}{name}" for name in names)
+
+
+def refresh_view(engine):
+    """(Re)create emails_all, the UNION ALL of the hot table and every shard."""
+    with engine.begin() as conn:
+        shards = sqlite_shards(conn)
+        conn.exec_driver_sql("DROP VIEW IF EXISTS emails_all")
+        conn.exec_driver_sql(f"CREATE VIEW emails_all AS {_union([emails.name] + [shards[m] for m in sorted(shards)], '')}")
+
+
+def seal_months(engine, before=None, hot_months=DEFAULT_HOT_MONTHS):
+    """
+    SQLite: move every emails row older than `before` (default: the start of
+    the hot months) into its month's shard, one transaction per month.
+    The newest row stays behind whatever its month. Returns {month: rows moved}.
+    """
+    before = month_start(before or add_months(month_start(datetime.date.today()), 1 - hot_months))
+    with engine.connect() as conn:
+        # Shards and emails_all carry every model column
+        missing = [c.name for c in emails.columns if c not in existing_columns(conn)]
+        if missing:
+            raise RuntimeError(f"emails lacks {', '.join(missing)}; run `python cohorts.py --migrate` before sealing")
+        first = conn.execute(select(func.min(emails.c.timestamp)).where(emails.c.timestamp < before)).scalar()
+        max_id = conn.execute(select(func.max(emails.c.id))).scalar()
+    moved = {}
+    if first is not None:
+        for month in months_between(first, add_months(before, -1)):
+            shard = shard_table(month)
+            with engine.begin() as conn:
+                shard.create(conn, checkfirst=True)
+                rows = conn.execute(
+                    shard.insert().from_select([c.name for c in emails.columns],
+                                               select(*emails.c).where(_in_month(emails, month), emails.c.id < max_id))
+                ).rowcount
+                conn.execute(delete(emails).where(_in_month(emails, month), emails.c.id < max_id))
+            if rows:
+                moved[month] = rows
+    refresh_view(engine)
+    return moved
+
+
+def _on(condition, column):
+    return (isinstance(condition, BinaryExpression)
+            and any(c is column for c in getattr(condition.left, 'proxy_set', ())))
+
+
+def _window(stmt):
+    # (start, end) of a top-level `emails.timestamp BETWEEN start AND end`, or of
+    # a pair of top-level lower (>=, >) and upper (<, <=) bounds, or None
+    where = stmt.whereclause
+    if where is None:
+        return None
+    conditions = where.clauses if isinstance(where, BooleanClauseList) and where.operator is operators.and_ else [where]
+    lower = upper = None
+    for condition in conditions:
+        if not _on(condition, emails.c.timestamp):
+            continue
+        if condition.operator is operators.between_op:
+            bounds = [getattr(bound, 'effective_value', None) for bound in condition.right.clauses]
+            if all(isinstance(b, datetime.datetime) for b in bounds):
+                return tuple(bounds)
+            continue
+        value = getattr(condition.right, 'effective_value', None)
+        if isinstance(value, datetime.datetime):
+            if condition.operator in (operators.ge, operators.gt):
+                lower = value
+            elif condition.operator in (operators.lt, operators.le):
+                upper = value
+    return (lower, upper) if lower is not None and upper is not None else None
+
+
+def _id_floor(condition):
+    # An id every row matching the condition is above, or None if it does not bound emails.id from below
+    if isinstance(condition, Grouping):
+        condition = condition.element
+    if isinstance(condition, BooleanClauseList):
+        floors = [_id_floor(c) for c in condition.clauses]
+        if condition.operator is operators.and_:
+            floors = [f for f in floors if f is not None]
+            return max(floors) if floors else None
+        if condition.operator is operators.or_ and None not in floors:
+            return min(floors)
+        return None
+    if _on(condition, emails.c.id):
+        value = getattr(condition.right, 'effective_value', None)
+        if condition.operator is operators.gt and isinstance(value, int):
+            return value
+        if condition.operator in (operators.ge, operators.eq) and isinstance(value, int):
+            return value - 1
+        if condition.operator is operators.in_op and value:
+            return min(value) - 1
+    return None
+
+
+def _shard_max_id(conn, name):
+    return conn.exec_driver_sql(f"SELECT max(id) FROM main.{name}").scalar() or 0
+
+
+def _emails_references(stmt):
+    return {id(e) for e in visitors.iterate(stmt)
+            if e is emails or (isinstance(e, Alias) and e.element is emails)}
+
+
+def _route(conn, clauseelement, multiparams, params, execution_options):
+    if not isinstance(clauseelement, Select):
+        return clauseelement, multiparams, params
+    window = _window(clauseelement)
+    floor = _id_floor(clauseelement.whereclause) if window is None else None
+    if window is None and floor is None:
+        return clauseelement, multiparams, params
+    shards = sqlite_shards(conn)
+    if window is not None:
+        first, last = month_start(window[0]), month_start(window[1])
+        if len(_emails_references(clauseelement)) > 1:
+            last = datetime.date.max
+        names = [shards[m] for m in sorted(shards) if first <= m <= last]
+    else:
+        names = [shards[m] for m in sorted(shards) if _shard_max_id(conn, shards[m]) > floor]
+    if not names:
+        return clauseelement, multiparams, params
+    source = text(_union([emails.name] + names)).columns(*emails.c).cte(emails.name).prefix_with("NOT MATERIALIZED")
+    return clauseelement.add_cte(source), multiparams, params
+
+
+def install(engine):
+    """Route windowed and id-bounded reads of this SQLite engine to the hot table plus the shards they need."""
+    if engine.dialect.name == "sqlite" and not event.contains(engine, "before_execute", _route):
+        event.listen(engine, "before_execute", _route, retval=True)
+    return engine
+
+
+# --- MYSQL PARTITIONS ---
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def _partition_clause(month):
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{add_months(month, 1).isoformat()}'))"
+
+
+def mysql_partitions(conn):
+    """{month: partition name} of the monthly partitions (pmax excluded)."""
+    rows = conn.exec_driver_sql(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+        (emails.name,),
+    ).scalars().all()
+    months = {}
+    for name in rows:
+        match = re.match(r'^p(\d{4})(\d{2})$', name)
+        if match:
+            months[datetime.date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+
+def partition_mysql(engine, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Partition emails by month on first run (the primary key becomes
+    (id, timestamp), which MySQL requires), later add the partitions up to
+    months_ahead months after the current one by splitting pmax. Returns
+    the months added.
+    """
+    until = add_months(month_start(datetime.date.today()), months_ahead)
+    with engine.begin() as conn:
+        existing = mysql_partitions(conn)
+        if not existing:
+            first = conn.execute(select(func.min(emails.c.timestamp))).scalar() or datetime.date.today()
+            added = months_between(first, until)
+            conn.exec_driver_sql(f"ALTER TABLE {emails.name} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+            conn.exec_driver_sql(
+                f"ALTER TABLE {emails.name} PARTITION BY RANGE (TO_DAYS(timestamp)) ("
+                + ", ".join(_partition_clause(m) for m in added)
+                + ", PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+            return added
+        added = [m for m in months_between(add_months(max(existing), 1), until)] if max(existing) < until else []
+        if added:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {emails.name} REORGANIZE PARTITION pmax INTO ("
+                + ", ".join(_partition_clause(m) for m in added)
+                + ", PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+    return added
+
+
+# --- RETENTION & ARCHIVE ---
+
+def archived_months(root=DEFAULT_ARCHIVE_DIR):
+    months = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            match = re.match(r'^month=(\d{4})-(\d{2})$', name)
+            if match and os.path.exists(os.path.join(root, name, "part.parquet")):
+                months.append(datetime.date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def archived_overlap(root, start_dt, end_dt):
+    """Archived months that overlap the window."""
+    first, last = month_start(start_dt), month_start(end_dt)
+    return [m for m in archived_months(root) if first <= m <= last]
+
+
+def _write_archive(conn, root, month, source, chunksize=DEFAULT_CHUNKSIZE):
+    partition = os.path.join(root, f"month={month:%Y-%m}")
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, "part.parquet")
+    rows = 0
+    with pq.ParquetWriter(path + '.tmp', snapshot.ARROW_SCHEMA, compression='zstd') as writer:
+        columns = {c.name for c in existing_columns(conn, source)}
+        stmt = (
+            select(*[source.c[c] for c in snapshot.ARROW_SCHEMA.names if c in columns])
+            .where(_in_month(source, month)).order_by(source.c.id)
+        )
+        for chunk in pd.read_sql(stmt, conn.execution_options(stream_results=True), chunksize=chunksize):
+            # Missing columns (reply_to_id before the cohorts migration) are archived as nulls
+            chunk = chunk.reindex(columns=snapshot.ARROW_SCHEMA.names)
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+            chunk['is_reply'] = chunk['is_reply'].astype('boolean')
+            chunk['reply_time_delta_seconds'] = chunk['reply_time_delta_seconds'].astype('Int32')
+            chunk['reply_to_id'] = chunk['reply_to_id'].astype('Int64')
+            writer.write_table(pa.Table.from_pandas(chunk, schema=snapshot.ARROW_SCHEMA, preserve_index=False))
+            rows += len(chunk)
+    os.replace(path + '.tmp', path)
+    return rows
+
+
+def archive_months(engine, root=DEFAULT_ARCHIVE_DIR, retention_months=DEFAULT_RETENTION_MONTHS, today=None):
+    """
+    Write every month before the retention period to the archive, check the
+    file holds all of its rows, then drop the month from the database
+    (SQLite: the shard table, MySQL: the partition). Returns {month: rows}.
+    """
+    cutoff = add_months(month_start(today or datetime.date.today()), 1 - retention_months)
+    sqlite = engine.dialect.name == "sqlite"
+    if sqlite:
+        seal_months(engine, before=cutoff)
+    with engine.connect() as conn:
+        months = sqlite_shards(conn) if sqlite else mysql_partitions(conn)
+    archived = {}
+    for month in sorted(m for m in months if m < cutoff):
+        source = shard_table(month) if sqlite else emails
+        with engine.connect() as conn:
+            rows = _write_archive(conn, root, month, source)
+            expected = conn.execute(select(func.count()).select_from(source).where(_in_month(source, month))).scalar()
+        written = pq.ParquetFile(os.path.join(root, f"month={month:%Y-%m}", "part.parquet")).metadata.num_rows
+        if rows != expected or written != expected:
+            raise RuntimeError(f"archive of {month:%Y-%m} has {written} rows, the database {expected}; kept both")
+        with engine.begin() as conn:
+            if sqlite:
+                conn.exec_driver_sql(f"DROP TABLE {months[month]}")
+            else:
+                conn.exec_driver_sql(f"ALTER TABLE {emails.name} DROP PARTITION {months[month]}")
+        archived[month] = rows
+    if sqlite:
+        refresh_view(engine)
+    return archived
+
+
+def _archive_dataset(root, start_dt, end_dt):
+    dataset = ds.dataset(
+        root, format='parquet', partitioning=ARCHIVE_PARTITIONING,
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+        schema=snapshot.ARROW_SCHEMA.append(pa.field('month', pa.string())),
+    )
+    predicate = (
+        (ds.field('month') >= f"{start_dt:%Y-%m}") & (ds.field('month') <= f"{end_dt:%Y-%m}")
+        & (ds.field('timestamp') >= pa.scalar(start_dt, type=pa.timestamp('us')))
+        & (ds.field('timestamp') <= pa.scalar(end_dt, type=pa.timestamp('us')))
+    )
+    return dataset, predicate
+
+
+def iter_archive_chunks(root, start_dt, end_dt, columns=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Archived rows of the window in frames of at most chunksize rows; only overlapping months are opened."""
+    if not archived_overlap(root, start_dt, end_dt):
+        return
+    dataset, predicate = _archive_dataset(root, start_dt, end_dt)
+    columns = columns or snapshot.ARROW_SCHEMA.names
+    for batch in dataset.to_batches(columns=columns, filter=predicate, batch_size=chunksize):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def read_archive(root, start_dt, end_dt, columns=None):
+    chunks = list(iter_archive_chunks(root, start_dt, end_dt, columns))
+    if not chunks:
+        return pd.DataFrame(columns=columns or snapshot.ARROW_SCHEMA.names)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def stream_panels(engine, root, start_dt, end_dt, chunksize=DEFAULT_CHUNKSIZE):
+    """Every panel of the window from the database rows plus the archived ones."""
+    accumulator = PanelAccumulator(window=(start_dt, end_dt))
+    with engine.connect() as conn:
+        for chunk in iter_window_chunks(conn, start_dt, end_dt, chunksize=chunksize):
+            accumulator.update(chunk)
+    for chunk in iter_archive_chunks(root, start_dt, end_dt, PROJECTED_COLUMNS, chunksize=chunksize):
+        accumulator.update(chunk)
+    return accumulator.panels()
+
+
+# --- VERIFICATION ---
+
+def check_partitions(num_rows=60_000, days=400, seed=3):
+    """
+    On a generated SQLite dataset: panels over several windows must not
+    change when old months are sealed into shards (and only overlapping
+    shards may be read). Rebuilding the rollup and the sketches and a full
+    snapshot export after sealing must still see every row, and the cohort
+    backfill must refuse the sealed database. After archiving the panels
+    must match again once the archive is read back.
+    """
+    # Imported here: both define ORM tables and import this module, so a
+    # module-level import would define them twice when they run as scripts
+    import rollup
+    import sketches
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = install(create_engine(f"sqlite:///{os.path.join(tmp, 'partition_check.db')}"))
+        root = os.path.join(tmp, "archive")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        generate_mock_data_fast(engine, num_rows=num_rows, days=days, seed=seed)
+        today = datetime.date.today()
+
+        def window(first, last):
+            return (datetime.datetime.combine(today - datetime.timedelta(days=first), datetime.time.min),
+                    datetime.datetime.combine(today - datetime.timedelta(days=last), datetime.time.max))
+
+        windows = [window(6, 0), window(29, 0), window(89, 0), window(300, 250), window(days, 0)]
+        baseline = [queries.load_panels(engine, *w) for w in windows]
+
+        def derived():
+            rollup.rebuild_rollup(engine)
+            sketches.rebuild_sketches(engine)
+            with engine.connect() as conn:
+                quantiles = [sketches.query_reply_time_quantiles(conn, *w) for w in windows]
+            return [{**rollup.load_panels(engine, *w), 'quantiles': q} for w, q in zip(windows, quantiles)]
+
+        derived_baseline = derived()
+        with engine.connect() as conn:
+            total = conn.execute(select(func.count()).select_from(emails)).scalar()
+
+        moved = seal_months(engine)
+        print(f"sealed {len(moved)} month(s), {sum(moved.values()):,} rows")
+        for (start_dt, end_dt), expected in zip(windows, baseline):
+            statements = []
+            record = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(engine, "before_cursor_execute", record)
+            try:
+                bad = _mismatches(queries.load_panels(engine, start_dt, end_dt), expected)
+            finally:
+                event.remove(engine, "before_cursor_execute", record)
+            read = {name for s in statements for name in re.findall(r'main\.(emails_p\d{6})', s)}
+            allowed = {shard_name(m) for m in months_between(start_dt, end_dt)}
+            pruned = read <= allowed
+            print(f"sealed   {start_dt:%Y-%m-%d} .. {end_dt:%Y-%m-%d}: {len(read)} shard(s) read: "
+                  f"{'OK' if not bad and pruned else 'MISMATCH ' + ', '.join(bad or ['pruning'])}")
+            ok = ok and not bad and pruned
+
+        # Rebuilds start from id watermark 0 and read the shards by id
+        for (start_dt, end_dt), panels, expected in zip(windows, derived(), derived_baseline):
+            bad = _mismatches(panels, expected)
+            print(f"rebuilt  {start_dt:%Y-%m-%d} .. {end_dt:%Y-%m-%d}: {'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+            ok = ok and not bad
+        snapshot_root = os.path.join(tmp, "snapshot")
+        with contextlib.redirect_stdout(io.StringIO()):
+            snapshot.export_snapshot(engine, snapshot_root, full=True)
+        exported = len(snapshot.load_window(snapshot_root, datetime.datetime.min, datetime.datetime.max, ['id', 'timestamp']))
+        print(f"snapshot: {exported:,} of {total:,} rows exported: {'OK' if exported == total else 'MISMATCH'}")
+        try:
+            cohorts.backfill_reply_to(engine)
+            refused = False
+        except RuntimeError:
+            refused = True
+        print(f"cohort backfill on sealed months: {'refused, OK' if refused else 'MISMATCH'}")
+        ok = ok and exported == total and refused
+
+        archived = archive_months(engine, root, retention_months=6)
+        print(f"archived {len(archived)} month(s), {sum(archived.values()):,} rows")
+        cutoff = add_months(month_start(today), -5)
+        for (start_dt, end_dt), expected in zip(windows, baseline):
+            if start_dt.date() >= cutoff:
+                bad = _mismatches(queries.load_panels(engine, start_dt, end_dt), expected)
+                label = "database"
+            else:
+                bad = _mismatches(stream_panels(engine, root, start_dt, end_dt, chunksize=5000), expected)
+                label = "+archive"
+            print(f"{label:<8} {start_dt:%Y-%m-%d} .. {end_dt:%Y-%m-%d}: {'OK' if not bad else 'MISMATCH ' + ', '.join(bad)}")
+            ok = ok and not bad
+        engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition, seal and archive the emails table by month.")
+    parser.add_argument("command", choices=["status", "partition", "archive", "check"],
+                        help="partition: MySQL monthly partitions / SQLite sealing of old months; "
+                             "archive: move months past the retention period to Parquet")
+    parser.add_argument("--archive-dir", default=os.environ.get("DASHBOARD_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR))
+    parser.add_argument("--retention-months", type=int, default=DEFAULT_RETENTION_MONTHS,
+                        help="months kept in the database, current month included")
+    parser.add_argument("--hot-months", type=int, default=DEFAULT_HOT_MONTHS,
+                        help="SQLite: months left in the emails table, current month included")
+    parser.add_argument("--months-ahead", type=int, default=DEFAULT_MONTHS_AHEAD,
+                        help="MySQL: partitions to keep ready after the current month")
+    parser.add_argument("--rows", type=int, default=60_000, help="mock rows for check")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        raise SystemExit(0 if check_partitions(args.rows) else 1)
+
+    engine = create_engine(DB_URL)
+    sqlite = engine.dialect.name == "sqlite"
+    if args.command == "partition":
+        if sqlite:
+            moved = seal_months(engine, hot_months=args.hot_months)
+            print(f"Sealed {sum(moved.values()):,} rows into {len(moved)} month shard(s).")
+        else:
+            added = partition_mysql(engine, months_ahead=args.months_ahead)
+            print(f"Added {len(added)} monthly partition(s).")
+    elif args.command == "archive":
+        archived = archive_months(engine, args.archive_dir, retention_months=args.retention_months)
+        for month, rows in archived.items():
+            print(f"  {month:%Y-%m}: {rows:,} rows -> {args.archive_dir}")
+        print(f"Archived {len(archived)} month(s).")
+    with engine.connect() as conn:
+        months = sqlite_shards(conn) if sqlite else mysql_partitions(conn)
+    print(f"{'Shards' if sqlite else 'Partitions'}: {', '.join(f'{m:%Y-%m}' for m in sorted(months)) or 'none'}")
+    print(f"Archived: {', '.join(f'{m:%Y-%m}' for m in archived_months(args.archive_dir)) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
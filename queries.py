@@ -0,0 +1,258 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import pandas as pd
+from sqlalchemy import select, func, case, and_, extract
+
+import instrumentation
+from metrics import (
+    SECONDS_PER_DAY,
+    metrics_frame, timeline_frame, timeline_resolution, sentiment_frame, lead_rate_frame, funnel_frame,
+    weekday_frame, hourly_frame, reply_time_histogram_frame, top_companies_frame,
+)
+from mock_db import Email
+
+# --- TABLE & COMMON PREDICATES ---
+emails = Email.__table__
+
+IS_SENT = emails.c.direction == 'sent'
+IS_REPLY = and_(emails.c.direction == 'received', emails.c.is_reply)
+IS_LEAD = and_(IS_REPLY, emails.c.reply_sentiment == 'positive')
+
+
+def in_window(start_dt, end_dt):
+    return emails.c.timestamp.between(start_dt, end_dt)
+
+
+def count_if(condition):
+    # Portable conditional count (MySQL and SQLite both accept SUM(CASE ...))
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+# --- PER-PANEL AGGREGATE QUERIES ---
+# Each function runs one GROUP BY against the emails table and returns the
+# finished panel frame. Only aggregate rows ever leave the database.
+
+def query_metrics(conn, start_dt, end_dt):
+    stmt = select(
+        func.count().label('total_emails'),
+        count_if(IS_SENT).label('total_sent'),
+        count_if(IS_REPLY).label('total_replies'),
+        count_if(IS_LEAD).label('total_leads'),
+        func.avg(case((IS_REPLY, emails.c.reply_time_delta_seconds))).label('avg_reply_seconds'),
+    ).where(in_window(start_dt, end_dt))
+    row = conn.execute(stmt).one()
+    return metrics_frame(row.total_emails, row.total_sent, row.total_replies,
+                         row.total_leads, row.avg_reply_seconds)
+
+
+def timeline_keys(timestamp, resolution):
+    # Bucket columns for metrics.timeline_frame; weeks are folded from days there
+    if resolution == 'month':
+        return [extract('year', timestamp).label('year'), extract('month', timestamp).label('month')]
+    keys = [func.date(timestamp).label('day')]
+    if resolution == 'hour':
+        keys.append(extract('hour', timestamp).label('hour'))
+    return keys
+
+
+def query_daily(conn, start_dt, end_dt):
+    # Emails Over Time, bucketed at the resolution the window allows
+    resolution = timeline_resolution(start_dt, end_dt)
+    keys = timeline_keys(emails.c.timestamp, resolution)
+    stmt = (
+        select(*keys, emails.c.direction, func.count().label('count'))
+        .where(in_window(start_dt, end_dt))
+        .group_by(*keys, emails.c.direction)
+    )
+    return timeline_frame(pd.read_sql(stmt, conn), resolution)
+
+
+def query_sentiment(conn, start_dt, end_dt):
+    stmt = (
+        select(emails.c.reply_sentiment, func.count().label('count'))
+        .where(in_window(start_dt, end_dt), IS_REPLY)
+        .group_by(emails.c.reply_sentiment)
+    )
+    return sentiment_frame(pd.read_sql(stmt, conn))
+
+
+def query_dimension_counts(conn, start_dt, end_dt, dim):
+    column = emails.c[dim]
+    stmt = (
+        select(
+            column,
+            count_if(IS_SENT).label('sent'),
+            count_if(IS_REPLY).label('replies'),
+            count_if(IS_LEAD).label('leads'),
+        )
+        .where(in_window(start_dt, end_dt))
+        .group_by(column)
+    )
+    return pd.read_sql(stmt, conn)
+
+
+def query_reply_day_hour(conn, start_dt, end_dt):
+    # Day + hour of every reply; small enough to derive both the weekday and
+    # the hourly panel from one query.
+    day = func.date(emails.c.timestamp).label('day')
+    hour = extract('hour', emails.c.timestamp).label('hour')
+    stmt = (
+        select(day, hour, func.count().label('count'))
+        .where(in_window(start_dt, end_dt), IS_REPLY)
+        .group_by(day, hour)
+    )
+    return pd.read_sql(stmt, conn)
+
+
+def query_reply_time_histogram(conn, start_dt, end_dt):
+    # Integer ceil(seconds / 86400); // renders as DIV on MySQL
+    reply_day = ((emails.c.reply_time_delta_seconds + (SECONDS_PER_DAY - 1)) // SECONDS_PER_DAY).label('reply_day')
+    stmt = (
+        select(reply_day, func.count().label('count'))
+        .where(in_window(start_dt, end_dt), IS_LEAD, emails.c.reply_time_delta_seconds.is_not(None))
+        .group_by(reply_day)
+    )
+    return reply_time_histogram_frame(pd.read_sql(stmt, conn))
+
+
+def query_top_companies(conn, start_dt, end_dt, limit=10):
+    count = func.count().label('count')
+    stmt = (
+        select(emails.c.company_name, count)
+        .where(in_window(start_dt, end_dt), IS_LEAD, emails.c.company_name.is_not(None))
+        .group_by(emails.c.company_name)
+        .order_by(count.desc(), emails.c.company_name)
+        .limit(limit)
+    )
+    return top_companies_frame(pd.read_sql(stmt, conn), limit=limit)
+
+
+def query_title_lead_rate(conn, start_dt, end_dt):
+    return lead_rate_frame(query_dimension_counts(conn, start_dt, end_dt, 'contact_title'), 'contact_title')
+
+
+def query_agent_lead_rate(conn, start_dt, end_dt):
+    return lead_rate_frame(query_dimension_counts(conn, start_dt, end_dt, 'ai_agent'), 'ai_agent')
+
+
+def query_city_funnel(conn, start_dt, end_dt):
+    return funnel_frame(query_dimension_counts(conn, start_dt, end_dt, 'city'), 'city')
+
+
+def query_industry_funnel(conn, start_dt, end_dt):
+    return funnel_frame(query_dimension_counts(conn, start_dt, end_dt, 'company_industry'), 'company_industry')
+
+
+def query_weekday(conn, start_dt, end_dt):
+    return weekday_frame(query_reply_day_hour(conn, start_dt, end_dt))
+
+
+def query_hourly(conn, start_dt, end_dt):
+    return hourly_frame(query_reply_day_hour(conn, start_dt, end_dt))
+
+
+# Panel name -> query function. The dashboard renders these by name.
+PANEL_QUERIES = {
+    'metrics': query_metrics,
+    'daily': query_daily,
+    'sentiment': query_sentiment,
+    'title_lead_rate': query_title_lead_rate,
+    'agent_lead_rate': query_agent_lead_rate,
+    'weekday': query_weekday,
+    'hourly': query_hourly,
+    'reply_time_hist': query_reply_time_histogram,
+    'top_companies': query_top_companies,
+    'city_funnel': query_city_funnel,
+    'industry_funnel': query_industry_funnel,
+}
+
+
+def _run_panel(name, start_dt, end_dt, conn):
+    with instrumentation.span(f"panel.{name}", "query") as s:
+        frame = PANEL_QUERIES[name](conn, start_dt, end_dt)
+        s.result(frame)
+    return {name: frame}
+
+
+def _run_day_hour_panels(names, start_dt, end_dt, conn):
+    # Share the reply day/hour aggregate between the weekday and hourly panels
+    with instrumentation.span(f"panel.{'+'.join(names)}", "query") as s:
+        day_hour = query_reply_day_hour(conn, start_dt, end_dt)
+        frames = {name: weekday_frame(day_hour) if name == 'weekday' else hourly_frame(day_hour) for name in names}
+        s.result(frames)
+    return frames
+
+
+def panel_jobs(names, start_dt, end_dt):
+    """Split panels into independent jobs: [(panel names, fn(conn) -> {name: frame}), ...]."""
+    jobs = [([name], partial(_run_panel, name, start_dt, end_dt))
+            for name in names if name not in ('weekday', 'hourly')]
+    shared = [name for name in names if name in ('weekday', 'hourly')]
+    if shared:
+        jobs.append((shared, partial(_run_day_hour_panels, shared, start_dt, end_dt)))
+    return jobs
+
+
+def run_panel_jobs(engine, jobs, max_workers=1, timeout=None):
+    """
+    Run panel jobs and return (results, failures), failures mapping every
+    panel of a failed job to its exception. With max_workers <= 1 the jobs
+    run one after another on one connection. Otherwise each job checks out
+    its own pooled connection on a worker thread and results are collected
+    as they complete; jobs still running after timeout seconds fail with
+    TimeoutError and are left to finish in the background.
+    """
+    results, failures = {}, {}
+    if max_workers <= 1 or len(jobs) <= 1:
+        with engine.connect() as conn:
+            for names, job in jobs:
+                try:
+                    results.update(job(conn))
+                except Exception as e:
+                    conn.rollback()
+                    failures.update(dict.fromkeys(names, e))
+        return results, failures
+
+    def run(job):
+        with engine.connect() as conn:
+            return job(conn)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="panel")
+    # copy_context() carries the caller's instrumentation run into the worker
+    futures = {executor.submit(contextvars.copy_context().run, run, job): names for names, job in jobs}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            try:
+                results.update(future.result())
+            except Exception as e:
+                failures.update(dict.fromkeys(futures[future], e))
+    except TimeoutError:
+        for future in pending:
+            failures.update(dict.fromkeys(futures[future], TimeoutError(f"no result after {timeout}s")))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results, failures
+
+
+def load_panels(engine, start_dt, end_dt, panels=None, max_workers=1, timeout=None, errors=None):
+    """
+    Run the aggregate query for each requested panel (all by default) and
+    return {panel name: frame}. max_workers > 1 runs the queries
+    concurrently, see run_panel_jobs().
+
+    If errors is a dict, failed panels are left out of the result and their
+    exceptions stored in errors[name]; otherwise the first failure is raised
+    once all panels have finished.
+    """
+    names = list(PANEL_QUERIES) if panels is None else list(panels)
+    results, failures = run_panel_jobs(engine, panel_jobs(names, start_dt, end_dt),
+                                       max_workers=max_workers, timeout=timeout)
+    if failures:
+        if errors is None:
+            raise next(iter(failures.values()))
+        errors.update(failures)
+    return {name: results[name] for name in names if name in results}
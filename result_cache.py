@@ -0,0 +1,383 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# --- RESULT CACHE SHARED BY ALL DASHBOARD PROCESSES ON A HOST ---
+# st.cache_data is per process. This cache sits behind it: results are
+# pickled into a SQLite file or a directory that every Streamlit worker
+# opens, keyed on the normalized query and the date range. Entries expire
+# after ttl seconds and the least recently used ones are evicted once the
+# cache grows past max_bytes. Concurrent misses for the same key are
+# single-flighted with a lease: one caller computes, the others poll until
+# the result is stored (or the lease expires and one of them takes over).
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_BYTES = 512 * 2**20
+DEFAULT_LEASE_SECONDS = 120
+COUNTERS = ('hits', 'misses', 'waits', 'stores', 'evictions', 'timeouts')
+DEFAULT_PATHS = {'sqlite': ".cache/results.sqlite", 'disk': ".cache/results"}
+
+
+def normalize_query(statement):
+    """SQL text (or a SQLAlchemy statement) with whitespace collapsed, for use in keys."""
+    return ' '.join(str(statement).split())
+
+
+def make_key(*parts):
+    """Stable key for any JSON-able parts; datetimes and other objects are keyed by str()."""
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+# --- BACKENDS ---
+# A backend stores (created, payload bytes) per key, keeps LRU order, hands
+# out leases for single-flight and keeps the counters. Both backends are
+# safe to use from several threads and processes at once.
+
+class SQLiteBackend:
+    """Entries, leases and counters in one SQLite database (WAL mode)."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, payload BLOB NOT NULL, "
+                         "size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, token TEXT NOT NULL, "
+                         "expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        # A short-lived connection per call keeps the backend thread-safe
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return _Closing(conn)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT created, payload FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def put(self, key, payload, created):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                         (key, payload, len(payload), created, created))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self, max_bytes):
+        evicted = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                    if total <= max_bytes:
+                        break
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+            conn.execute("COMMIT")
+        return evicted
+
+    def acquire(self, key, lease_seconds):
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT expires FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (key, token, now + lease_seconds))
+            conn.execute("COMMIT")
+        return token
+
+    def release(self, key, token):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    def incr(self, name, n=1):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                         (name, n, n))
+
+    def counters(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT name, value FROM counters").fetchall())
+
+    def usage(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def clear(self):
+        with self._connect() as conn:
+            for table in ('entries', 'leases', 'counters'):
+                conn.execute(f"DELETE FROM {table}")
+
+
+class _Closing:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+        return False
+
+
+class DiskBackend:
+    """
+    One pickle file per entry in a directory; the file's mtime is its last
+    access. Leases are lock files created with O_EXCL. Every process keeps
+    its own counters file, so increments never race.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "_stats"), exist_ok=True)
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._counters_path = os.path.join(directory, "_stats", f"{socket.gethostname()}-{os.getpid()}.json")
+        self._counters_lock = threading.Lock()
+
+    def _path(self, key, suffix=".pkl"):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                created, payload = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return created, payload
+
+    def put(self, key, payload, created):
+        tmp = self._path(key, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((created, payload), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.pkl")):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, max_bytes):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return evicted
+
+    def acquire(self, key, lease_seconds):
+        token = uuid.uuid4().hex
+        path = self._path(key, ".lock")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if os.stat(path).st_mtime + lease_seconds > time.time():
+                        return None
+                    os.remove(path)  # expired lease of a crashed or stuck holder
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(token)
+            return token
+        return None
+
+    def release(self, key, token):
+        path = self._path(key, ".lock")
+        try:
+            with open(path) as f:
+                if f.read() == token:
+                    os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def incr(self, name, n=1):
+        with self._counters_lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+            tmp = self._counters_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._counters, f)
+            os.replace(tmp, self._counters_path)
+
+    def counters(self):
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, "_stats", "*.json")):
+            try:
+                with open(path) as f:
+                    for name, value in json.load(f).items():
+                        totals[name] = totals.get(name, 0) + value
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        return totals
+
+    def usage(self):
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, "*.pkl")) + \
+                glob.glob(os.path.join(self.directory, "*.lock")) + \
+                glob.glob(os.path.join(self.directory, "_stats", "*.json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._counters_lock:
+            self._counters = dict.fromkeys(COUNTERS, 0)
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'disk': DiskBackend}
+
+
+# --- CACHE ---
+
+class ResultCache:
+    def __init__(self, backend, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=0.05):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+    def _lookup(self, key):
+        row = self.backend.get(key)
+        if row is None:
+            return None
+        created, payload = row
+        if created + self.ttl < time.time():
+            self.backend.delete(key)
+            return None
+        return pickle.loads(payload)
+
+    def get_or_compute(self, key, compute, store=None):
+        """
+        Return the cached value for key, or compute() it. Only one caller
+        across all processes computes a given key at a time; the others
+        wait for its result. store(value) can veto caching a value (e.g. a
+        partial result); the value is still returned.
+        """
+        waited = False
+        deadline = time.monotonic() + self.lease_seconds
+        while True:
+            value = self._lookup(key)
+            if value is not None:
+                self.backend.incr('waits' if waited else 'hits')
+                return value
+            token = self.backend.acquire(key, self.lease_seconds)
+            if token is not None:
+                break
+            if time.monotonic() > deadline:
+                # The holder neither stored a result nor let its lease expire in time
+                self.backend.incr('timeouts')
+                return compute()
+            waited = True
+            time.sleep(self.poll_interval)
+        try:
+            # Another flight may have stored the value between the lookup and the lease
+            value = self._lookup(key)
+            if value is not None:
+                self.backend.incr('waits' if waited else 'hits')
+                return value
+            self.backend.incr('misses')
+            value = compute()
+            if store is None or store(value):
+                self.put(key, value)
+            return value
+        finally:
+            self.backend.release(key, token)
+
+    def get(self, key):
+        """The cached value for key or None, counted as a hit or a miss. No single-flight."""
+        value = self._lookup(key)
+        self.backend.incr('hits' if value is not None else 'misses')
+        return value
+
+    def put(self, key, value):
+        self.backend.put(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+        self.backend.incr('stores')
+        evicted = self.backend.evict(self.max_bytes)
+        if evicted:
+            self.backend.incr('evictions', evicted)
+
+    def stats(self):
+        """Counters since the last clear, plus current size. hit_rate counts waits as hits."""
+        counters = {name: 0 for name in COUNTERS}
+        counters.update(self.backend.counters())
+        served = counters['hits'] + counters['waits']
+        lookups = served + counters['misses']
+        entries, size = self.backend.usage()
+        return {**counters, 'hit_rate': served / lookups if lookups else None, 'entries': entries, 'bytes': size}
+
+    def clear(self):
+        self.backend.clear()
+
+
+def open_cache(kind, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+    """ResultCache on a 'sqlite' file or a 'disk' directory (DEFAULT_PATHS if path is None)."""
+    if kind not in BACKENDS:
+        raise ValueError(f"unknown result cache backend {kind!r}; expected one of {', '.join(BACKENDS)}")
+    return ResultCache(BACKENDS[kind](path or DEFAULT_PATHS[kind]), ttl=ttl, max_bytes=max_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the shared dashboard result cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--backend", choices=list(BACKENDS),
+                        default=os.environ.get("DASHBOARD_SHARED_CACHE", "sqlite"))
+    parser.add_argument("--path", default=os.environ.get("DASHBOARD_SHARED_CACHE_PATH"),
+                        help="cache file (sqlite) or directory (disk)")
+    args = parser.parse_args()
+    cache = open_cache(args.backend, args.path)
+    if args.command == "clear":
+        cache.clear()
+        print("Cleared the result cache.")
+    else:
+        for name, value in cache.stats().items():
+            print(f"{name:>10}: {value:.1%}" if name == 'hit_rate' and value is not None else f"{name:>10}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+from functools import partial
+
+import pandas as pd
+import numpy as np
+from sqlalchemy import (
+    create_engine, select, delete, func, case, and_,
+    Column, Integer, BigInteger, String, Date, Boolean, Enum, Index,
+)
+from sqlalchemy.orm import sessionmaker
+
+import id_watermarks
+import instrumentation
+import metrics
+import partitions
+import queries
+import sketches
+from mock_db import Base, Email, DB_URL, generate_mock_data
+
+# --- ROLLUP MODEL ---
+# One row per (day, direction, is_reply, reply_sentiment, ai_agent, city,
+# company_industry, contact_title). Built incrementally from emails rows
+# whose id is above the stored watermark.
+
+ROLLUP_KEYS = ['day', 'direction', 'is_reply', 'reply_sentiment', 'ai_agent',
+               'city', 'company_industry', 'contact_title']
+ROLLUP_MEASURES = ['email_count', 'reply_time_sum', 'reply_time_count']
+
+
+class EmailDailyRollup(Base):
+    __tablename__ = "email_daily_rollup"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    direction = Column(Enum('sent', 'received'), nullable=False)
+    is_reply = Column(Boolean)
+    reply_sentiment = Column(Enum('positive', 'neutral', 'negative', 'N/A'))
+    ai_agent = Column(String(100))
+    city = Column(String(100))
+    company_industry = Column(String(100))
+    contact_title = Column(String(100))
+
+    email_count = Column(Integer, nullable=False, default=0)
+    reply_time_sum = Column(BigInteger, nullable=False, default=0)    # SUM(reply_time_delta_seconds)
+    reply_time_count = Column(Integer, nullable=False, default=0)     # COUNT(reply_time_delta_seconds)
+
+    __table_args__ = (Index('ix_email_daily_rollup_day', 'day', 'direction'),)
+
+
+class EmailRollupWatermark(Base):
+    __tablename__ = "email_daily_rollup_state"
+
+    id = Column(Integer, primary_key=True)
+    last_email_id = Column(Integer, nullable=False, default=0)
+
+
+rollup = EmailDailyRollup.__table__
+watermark = EmailRollupWatermark.__table__
+emails = Email.__table__
+
+
+# --- BUILDER ---
+
+def _normalize_keys(df):
+    df['day'] = pd.to_datetime(df['day']).dt.date
+    # NULL dimensions must round-trip as None, not NaN
+    return df.astype(object).where(df.notna(), None)
+
+
+def update_rollup(engine):
+    """
+    Fold every emails row with id above the watermark (and the late
+    commits below it, see id_watermarks.py) into the rollup and advance
+    the watermark. Only the days touched by new rows are rewritten.
+    Returns the number of emails folded in.
+    """
+    Base.metadata.create_all(bind=engine, tables=[rollup, watermark, id_watermarks.gaps])
+    id_watermarks.ensure_state_row(engine, watermark, id=1, last_email_id=0)
+    with engine.begin() as conn:
+        last_id = conn.execute(
+            select(watermark.c.last_email_id).where(watermark.c.id == 1).with_for_update()
+        ).scalar()
+        max_id = conn.execute(select(func.max(emails.c.id))).scalar() or 0
+        if max_id < last_id:
+            # The emails table was regenerated underneath us; start over
+            conn.execute(delete(rollup))
+            last_id = 0
+        gap_ids = id_watermarks.pending_gaps(conn, 'rollup') if last_id else []
+        if max_id == last_id and not gap_ids:
+            return 0
+
+        day = func.date(emails.c.timestamp).label('day')
+        key_columns = [day] + [emails.c[k] for k in ROLLUP_KEYS[1:]]
+        delta = pd.read_sql(
+            select(
+                *key_columns,
+                func.count().label('email_count'),
+                func.coalesce(func.sum(emails.c.reply_time_delta_seconds), 0).label('reply_time_sum'),
+                func.count(emails.c.reply_time_delta_seconds).label('reply_time_count'),
+            )
+            .where(id_watermarks.new_rows(last_id, max_id, gap_ids))
+            .group_by(*key_columns),
+            conn,
+        )
+        new_rows = int(delta['email_count'].sum())
+        if not delta.empty:
+            delta = _normalize_keys(delta)
+            first_day, last_day = min(delta['day']), max(delta['day'])
+            existing = pd.read_sql(
+                select(*[rollup.c[c] for c in ROLLUP_KEYS + ROLLUP_MEASURES])
+                .where(rollup.c.day.between(first_day, last_day)),
+                conn,
+            )
+            merged = pd.concat([_normalize_keys(existing), delta], ignore_index=True) if not existing.empty else delta
+            merged = (
+                merged.groupby(ROLLUP_KEYS, dropna=False, sort=False)[ROLLUP_MEASURES]
+                .sum().reset_index()
+            )
+            merged = _normalize_keys(merged)
+            conn.execute(delete(rollup).where(rollup.c.day.between(first_day, last_day)))
+            conn.execute(rollup.insert(), merged.to_dict('records'))
+        id_watermarks.record_gaps(conn, 'rollup', max_id)
+        conn.execute(watermark.update().where(watermark.c.id == 1).values(last_email_id=max_id))
+    return new_rows
+
+
+def rebuild_rollup(engine):
+    """Drop all rollup rows and rebuild from the full emails table."""
+    Base.metadata.create_all(bind=engine, tables=[rollup, watermark])
+    with engine.begin() as conn:
+        conn.execute(delete(rollup))
+        conn.execute(delete(watermark))
+    return update_rollup(engine)
+
+
+# --- PANEL QUERIES ON THE ROLLUP ---
+# Count and rate panels only. The rollup is at day granularity, so a window
+# is answered for the whole days it covers (the dashboard always selects
+# whole days). Top companies come from the daily company sketches (see
+# sketches.py). Hourly replies, the reply-time histogram and Emails Over
+# Time on windows short enough to chart per hour need finer detail and are
+# answered from the emails table.
+
+R_SENT = rollup.c.direction == 'sent'
+R_REPLY = and_(rollup.c.direction == 'received', rollup.c.is_reply)
+R_LEAD = and_(R_REPLY, rollup.c.reply_sentiment == 'positive')
+
+
+def in_window(start_dt, end_dt):
+    return rollup.c.day.between(start_dt.date(), end_dt.date())
+
+
+def sum_if(condition, column=rollup.c.email_count):
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+def query_metrics(conn, start_dt, end_dt):
+    row = conn.execute(
+        select(
+            func.coalesce(func.sum(rollup.c.email_count), 0).label('total_emails'),
+            sum_if(R_SENT).label('total_sent'),
+            sum_if(R_REPLY).label('total_replies'),
+            sum_if(R_LEAD).label('total_leads'),
+            sum_if(R_REPLY, rollup.c.reply_time_sum).label('reply_time_sum'),
+            sum_if(R_REPLY, rollup.c.reply_time_count).label('reply_time_count'),
+        ).where(in_window(start_dt, end_dt))
+    ).one()
+    avg_reply = row.reply_time_sum / row.reply_time_count if row.reply_time_count else np.nan
+    return metrics.metrics_frame(row.total_emails, row.total_sent, row.total_replies,
+                                 row.total_leads, avg_reply)
+
+
+def query_daily(conn, start_dt, end_dt):
+    resolution = metrics.timeline_resolution(start_dt, end_dt)
+    if resolution == 'hour':
+        # Short windows are charted per hour, which only the emails table has
+        return queries.query_daily(conn, start_dt, end_dt)
+    keys = [rollup.c.day] if resolution != 'month' else queries.timeline_keys(rollup.c.day, resolution)
+    stmt = (
+        select(*keys, rollup.c.direction, func.sum(rollup.c.email_count).label('count'))
+        .where(in_window(start_dt, end_dt))
+        .group_by(*keys, rollup.c.direction)
+    )
+    return metrics.timeline_frame(pd.read_sql(stmt, conn), resolution)
+
+
+def query_sentiment(conn, start_dt, end_dt):
+    stmt = (
+        select(rollup.c.reply_sentiment, func.sum(rollup.c.email_count).label('count'))
+        .where(in_window(start_dt, end_dt), R_REPLY)
+        .group_by(rollup.c.reply_sentiment)
+    )
+    return metrics.sentiment_frame(pd.read_sql(stmt, conn))
+
+
+def query_dimension_counts(conn, start_dt, end_dt, dim):
+    column = rollup.c[dim]
+    stmt = (
+        select(
+            column,
+            sum_if(R_SENT).label('sent'),
+            sum_if(R_REPLY).label('replies'),
+            sum_if(R_LEAD).label('leads'),
+        )
+        .where(in_window(start_dt, end_dt))
+        .group_by(column)
+    )
+    return pd.read_sql(stmt, conn)
+
+
+def query_weekday(conn, start_dt, end_dt):
+    stmt = (
+        select(rollup.c.day, func.sum(rollup.c.email_count).label('count'))
+        .where(in_window(start_dt, end_dt), R_REPLY)
+        .group_by(rollup.c.day)
+    )
+    return metrics.weekday_frame(pd.read_sql(stmt, conn))
+
+
+ROLLUP_PANEL_QUERIES = {
+    'metrics': query_metrics,
+    'daily': query_daily,
+    'sentiment': query_sentiment,
+    'title_lead_rate': lambda conn, s, e: metrics.lead_rate_frame(
+        query_dimension_counts(conn, s, e, 'contact_title'), 'contact_title'),
+    'agent_lead_rate': lambda conn, s, e: metrics.lead_rate_frame(
+        query_dimension_counts(conn, s, e, 'ai_agent'), 'ai_agent'),
+    'weekday': query_weekday,
+    'city_funnel': lambda conn, s, e: metrics.funnel_frame(
+        query_dimension_counts(conn, s, e, 'city'), 'city'),
+    'industry_funnel': lambda conn, s, e: metrics.funnel_frame(
+        query_dimension_counts(conn, s, e, 'company_industry'), 'company_industry'),
+}
+
+
+def _run_rollup_panel(name, start_dt, end_dt, conn):
+    with instrumentation.span(f"panel.{name}", "query") as s:
+        frame = ROLLUP_PANEL_QUERIES[name](conn, start_dt, end_dt)
+        s.result(frame)
+    return {name: frame}
+
+
+def _run_top_companies_panel(start_dt, end_dt, conn):
+    with instrumentation.span("panel.top_companies", "query") as s:
+        frame, _ = sketches.query_top_companies(conn, start_dt, end_dt)
+        s.result(frame)
+    return {'top_companies': frame}
+
+
+def load_panels(engine, start_dt, end_dt, panels=None, max_workers=1, timeout=None, errors=None):
+    """
+    Same contract as queries.load_panels: count and rate panels come from the
+    rollup, top companies from the company sketches (update both first) and
+    everything else falls back to the emails table.
+    """
+    names = list(queries.PANEL_QUERIES) if panels is None else list(panels)
+    jobs = [([name], partial(_run_rollup_panel, name, start_dt, end_dt))
+            for name in names if name in ROLLUP_PANEL_QUERIES]
+    if 'top_companies' in names:
+        jobs.append((['top_companies'], partial(_run_top_companies_panel, start_dt, end_dt)))
+    jobs += queries.panel_jobs([name for name in names if name not in ROLLUP_PANEL_QUERIES
+                                and name != 'top_companies'], start_dt, end_dt)
+    results, failures = queries.run_panel_jobs(engine, jobs, max_workers=max_workers, timeout=timeout)
+    if failures:
+        if errors is None:
+            raise next(iter(failures.values()))
+        errors.update(failures)
+    return {name: results[name] for name in names if name in results}
+
+
+# --- CONSISTENCY CHECK ---
+
+def compare_with_raw(engine, start_dt, end_dt):
+    """
+    Compare every rollup-backed panel against the same panel recomputed from
+    raw emails rows. Returns a list of mismatching panel names.
+    """
+    from_rollup = load_panels(engine, start_dt, end_dt, panels=ROLLUP_PANEL_QUERIES)
+    from_raw = queries.load_panels(engine, start_dt, end_dt, panels=ROLLUP_PANEL_QUERIES)
+    mismatches = []
+    for name in ROLLUP_PANEL_QUERIES:
+        try:
+            pd.testing.assert_frame_equal(
+                from_rollup[name].reset_index(drop=True), from_raw[name].reset_index(drop=True),
+                check_dtype=False,
+            )
+        except AssertionError as e:
+            print(f"[{name}] rollup and raw recomputation differ:\n{e}")
+            mismatches.append(name)
+    return mismatches
+
+
+def check_consistency(num_entries=5000, seed=42):
+    """
+    Generate mock data into a throwaway SQLite database in two batches,
+    update the rollup after each one, and compare against raw recomputation
+    over several windows. A third batch has rows committing late, below the
+    watermark.
+    """
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'rollup_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        session = sessionmaker(bind=engine)()
+        mismatches = []
+        try:
+            for _ in range(2):
+                generate_mock_data(session, num_entries // 2)
+                folded = update_rollup(engine)
+                print(f"Folded {folded} new emails into the rollup.")
+                today = datetime.date.today()
+                for days in (1, 7, 30, 90, 365):
+                    start_dt = datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time.min)
+                    end_dt = datetime.datetime.combine(today, datetime.time.max)
+                    mismatches += compare_with_raw(engine, start_dt, end_dt)
+            # Late commits: rows below the watermark that only appear after a fold
+            generate_mock_data(session, num_entries // 4)
+            with engine.begin() as conn:
+                max_id = conn.execute(select(func.max(emails.c.id))).scalar()
+                conn.exec_driver_sql(f"CREATE TABLE late_emails AS SELECT * FROM {emails.name} "
+                                     f"WHERE id > {max_id - 200} AND id < {max_id}")
+                conn.exec_driver_sql(f"DELETE FROM {emails.name} WHERE id IN (SELECT id FROM late_emails)")
+            folded = update_rollup(engine)
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"INSERT INTO {emails.name} SELECT * FROM late_emails")
+            late = update_rollup(engine)
+            print(f"Folded {folded} new emails, then {late} late commits below the watermark.")
+            today = datetime.date.today()
+            mismatches += compare_with_raw(
+                engine,
+                datetime.datetime.combine(today - datetime.timedelta(days=365), datetime.time.min),
+                datetime.datetime.combine(today, datetime.time.max),
+            )
+            if late != 199:
+                mismatches.append("late commits")
+        finally:
+            session.close()
+            engine.dispose()
+    if mismatches:
+        print(f"Rollup is INCONSISTENT for: {sorted(set(mismatches))}")
+    else:
+        print("Rollup matches raw recomputation for every window.")
+    return not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily email rollup table.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the rollup from scratch")
+    parser.add_argument("--check", action="store_true",
+                        help="run the consistency check on a generated SQLite dataset")
+    parser.add_argument("--entries", type=int, default=5000, help="mock entries for --check")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check_consistency(args.entries) else 1)
+
+    engine = partitions.install(create_engine(DB_URL))
+    folded = rebuild_rollup(engine) if args.rebuild else update_rollup(engine)
+    print(f"Folded {folded} emails into the rollup.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,579 @@
+import argparse
+import datetime
+import math
+import os
+import tempfile
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    create_engine, select, delete, func,
+    Column, Integer, String, Date, LargeBinary, Index,
+)
+
+import id_watermarks
+import metrics
+import partitions
+import queries
+from mock_db import Base, Email, DB_URL, generate_mock_data_fast
+
+# --- DAILY MERGEABLE SKETCHES ---
+# Small per-day summaries that answer a window by merging its days instead
+# of scanning emails rows, so the cost grows with the number of days, not
+# with the table. Like the rollup, each sketch family is built
+# incrementally from emails rows whose id is above its own watermark, and
+# answers whole days only (the dashboard always selects whole days).
+#
+# Reply-time quantiles (DDSketch-style): every reply time x > 0 falls in
+# the log bucket i = ceil(log_gamma(x)) with gamma = (1 + a) / (1 - a), and
+# the bucket is read back as 2 * gamma**i / (gamma + 1). Every value in
+# bucket i lies in (gamma**(i-1), gamma**i], so that representative is
+# within a relative error of a of each of them. Hence for any q the
+# estimate returned for a window is within a (default 1%) of the exact
+# "lower" quantile, i.e. the reply time at rank floor(q * (n - 1)) of the
+# sorted values (np.quantile(..., method='lower')). Zero seconds are kept
+# exactly. Sketches are stored per (day, dimension, value) as rows of
+# (bucket, count); merging is adding counts bucket by bucket, so a window
+# is one SUM(count) ... GROUP BY value, bucket over its days.
+#
+# Top companies (mergeable Space-Saving): each day keeps at most
+# TOP_CAPACITY companies, each with the positive replies counted since it
+# entered the list (count) and an upper bound on those it may have missed
+# before (error), plus a threshold: an upper bound on the true count of any
+# company not in the list. Every fold of new rows into a day adds the new
+# counts; a company entering the list gets the threshold as its error. The
+# list is then cut back to the companies with the highest count + error,
+# and the threshold rises to the largest count + error dropped. Errors
+# never exceed the threshold, so a company's stored count is short of its
+# true count by at most the day's threshold however often the day is
+# folded, and summed over the days of a window by at most the sum of their
+# thresholds. The top list of a window is ranked on those lower bounds, and
+# the bound is returned with it.
+#
+# Distinct companies and recipients (HyperLogLog): each day keeps
+# 2**HLL_PRECISION one-byte registers per column; merging days is an
+# element-wise max. The relative standard error is 1.04 / sqrt(registers),
+# about 1.6%.
+#
+# Windows with at most EXACT_MAX_ROWS rows to aggregate skip the sketches
+# and run the exact query on the emails table.
+
+EXACT_MAX_ROWS = 50_000
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+ZERO_BUCKET = -(2**31)  # reply_time_delta_seconds == 0
+
+# Dimensions with a sketch per value; 'all' has a single sketch with value ''
+SKETCH_DIMENSIONS = ['ai_agent', 'city', 'company_industry']
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+TOP_CAPACITY = 500  # companies kept per day
+HLL_PRECISION = 12
+HLL_REGISTERS = 2**HLL_PRECISION
+HLL_RANK_BITS = 64 - HLL_PRECISION
+
+
+class ReplyTimeSketch(Base):
+    __tablename__ = "email_reply_time_sketch"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    dimension = Column(String(32), nullable=False)
+    value = Column(String(100), nullable=False)
+    bucket = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+
+    __table_args__ = (Index('ix_email_reply_time_sketch_day', 'dimension', 'day'),)
+
+
+class CompanyDaySketch(Base):
+    __tablename__ = "email_company_day_sketch"
+
+    day = Column(Date, primary_key=True)
+    sent = Column(Integer, nullable=False, default=0)           # sent emails
+    leads = Column(Integer, nullable=False, default=0)          # positive replies with a company
+    lead_threshold = Column(Integer, nullable=False, default=0)  # bound on any unlisted company's count
+    company_hll = Column(LargeBinary, nullable=False)           # companies emailed
+    recipient_hll = Column(LargeBinary, nullable=False)         # recipients emailed
+
+
+class CompanyTopSketch(Base):
+    __tablename__ = "email_company_top_sketch"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    company_name = Column(String(255), nullable=False)
+    count = Column(Integer, nullable=False)             # counted since the company entered the day's list
+    error = Column(Integer, nullable=False, default=0)  # bound on the count missed before that
+
+    __table_args__ = (Index('ix_email_company_top_sketch_day', 'day'),)
+
+
+class SketchWatermark(Base):
+    __tablename__ = "email_sketch_state"
+
+    sketch = Column(String(32), primary_key=True)
+    last_email_id = Column(Integer, nullable=False, default=0)
+
+
+reply_sketch = ReplyTimeSketch.__table__
+company_day = CompanyDaySketch.__table__
+company_top = CompanyTopSketch.__table__
+watermark = SketchWatermark.__table__
+emails = Email.__table__
+
+SKETCH_KEYS = ['day', 'dimension', 'value', 'bucket']
+
+
+# --- QUANTILE SKETCH MATH ---
+
+def bucket_index(values):
+    """Bucket of every reply time in seconds (array-like of numbers >= 0)."""
+    values = np.asarray(values, dtype='float64')
+    out = np.full(len(values), ZERO_BUCKET, dtype='int64')
+    positive = values > 0
+    out[positive] = np.ceil(np.log(values[positive]) / LOG_GAMMA).astype('int64')
+    return out
+
+
+def bucket_value(buckets):
+    buckets = np.asarray(buckets, dtype='int64')
+    return np.where(buckets == ZERO_BUCKET, 0.0, 2 * GAMMA ** buckets.astype('float64') / (GAMMA + 1))
+
+
+def sketch_quantiles(buckets, counts, quantiles=DEFAULT_QUANTILES):
+    """Quantile estimates from one (merged) sketch given as bucket and count arrays."""
+    order = np.argsort(buckets, kind='stable')
+    buckets = np.asarray(buckets)[order]
+    cumulative = np.cumsum(np.asarray(counts)[order])
+    if not len(cumulative) or cumulative[-1] == 0:
+        return [np.nan] * len(quantiles)
+    ranks = np.floor(np.asarray(quantiles) * (cumulative[-1] - 1))
+    return list(bucket_value(buckets[np.searchsorted(cumulative, ranks, side='right')]))
+
+
+def sketch_rows(df):
+    """
+    Sketch rows (day, dimension, value, bucket, count) for raw reply rows
+    with day, reply_time_delta_seconds and the SKETCH_DIMENSIONS columns.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=SKETCH_KEYS + ['count'])
+    df = df.assign(bucket=bucket_index(df['reply_time_delta_seconds']))
+    parts = [df.assign(dimension='all', value='')[SKETCH_KEYS]]
+    for dimension in SKETCH_DIMENSIONS:
+        part = df[df[dimension].notna()]
+        parts.append(part.assign(dimension=dimension, value=part[dimension].astype(str))[SKETCH_KEYS])
+    rows = pd.concat(parts, ignore_index=True)
+    return rows.groupby(SKETCH_KEYS, sort=False).size().reset_index(name='count')
+
+
+# --- HYPERLOGLOG ---
+
+def hll_hashes(values):
+    """(register index, rank) of every value; pandas' hash is stable across processes."""
+    hashes = pd.util.hash_pandas_object(pd.Series(values, dtype=object).astype(str), index=False).to_numpy()
+    index = (hashes >> np.uint64(HLL_RANK_BITS)).astype('int64')
+    rest = (hashes & np.uint64(2**HLL_RANK_BITS - 1)).astype('float64')  # exact below 2**53
+    # frexp's exponent is the bit length, so rank = leading zeros + 1
+    rank = (HLL_RANK_BITS + 1 - np.frexp(rest)[1]).astype('uint8')
+    return index, rank
+
+
+def hll_registers(index, rank):
+    registers = np.zeros(HLL_REGISTERS, dtype='uint8')
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def hll_estimate(registers):
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype('int64')))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+    return estimate
+
+
+def _registers(blob):
+    return np.frombuffer(blob, dtype='uint8')
+
+
+# --- BUILDERS ---
+
+def _new_rows(conn, columns, *conditions):
+    df = pd.read_sql(select(func.date(emails.c.timestamp).label('day'), *columns).where(*conditions), conn)
+    df['day'] = pd.to_datetime(df['day']).dt.date
+    return df
+
+
+def _reply_rows(conn, *conditions):
+    return _new_rows(conn, [emails.c.reply_time_delta_seconds, *[emails.c[d] for d in SKETCH_DIMENSIONS]],
+                     queries.IS_REPLY, emails.c.reply_time_delta_seconds.isnot(None), *conditions)
+
+
+def _fold_new_emails(engine, name, tables, fold):
+    """
+    Run fold(conn, condition) over the emails above the `name` watermark
+    (and the late commits below it, see id_watermarks.py) and advance it,
+    in one transaction. Returns fold's count.
+    """
+    Base.metadata.create_all(bind=engine, tables=tables + [watermark, id_watermarks.gaps])
+    id_watermarks.ensure_state_row(engine, watermark, sketch=name, last_email_id=0)
+    with engine.begin() as conn:
+        last_id = conn.execute(
+            select(watermark.c.last_email_id).where(watermark.c.sketch == name).with_for_update()
+        ).scalar()
+        max_id = conn.execute(select(func.max(emails.c.id))).scalar() or 0
+        if max_id < last_id:
+            # The emails table was regenerated underneath us; start over
+            for table in tables:
+                conn.execute(delete(table))
+            last_id = 0
+        gap_ids = id_watermarks.pending_gaps(conn, name) if last_id else []
+        if max_id == last_id and not gap_ids:
+            return 0
+        folded = fold(conn, id_watermarks.new_rows(last_id, max_id, gap_ids))
+        id_watermarks.record_gaps(conn, name, max_id)
+        conn.execute(watermark.update().where(watermark.c.sketch == name).values(last_email_id=max_id))
+    return folded
+
+
+def _fold_reply_times(conn, *new):
+    replies = _reply_rows(conn, *new)
+    delta = sketch_rows(replies)
+    if not delta.empty:
+        first_day, last_day = min(delta['day']), max(delta['day'])
+        existing = pd.read_sql(
+            select(*[reply_sketch.c[c] for c in SKETCH_KEYS + ['count']])
+            .where(reply_sketch.c.day.between(first_day, last_day)),
+            conn,
+        )
+        if not existing.empty:
+            existing['day'] = pd.to_datetime(existing['day']).dt.date
+            delta = (
+                pd.concat([existing, delta], ignore_index=True)
+                .groupby(SKETCH_KEYS, sort=False)['count'].sum().reset_index()
+            )
+        conn.execute(delete(reply_sketch).where(reply_sketch.c.day.between(first_day, last_day)))
+        records = delta.astype({'bucket': 'int64', 'count': 'int64'}).astype(object).to_dict('records')
+        conn.execute(reply_sketch.insert(), records)
+    return len(replies)
+
+
+def _fold_companies(conn, *new, capacity=TOP_CAPACITY):
+    sent = _new_rows(conn, [emails.c.company_name, emails.c.recipient_email], queries.IS_SENT, *new)
+    leads = _new_rows(conn, [emails.c.company_name], queries.IS_LEAD, emails.c.company_name.isnot(None), *new)
+    if sent.empty and leads.empty:
+        return 0
+    first_day = min(sent['day'].min() if not sent.empty else datetime.date.max,
+                    leads['day'].min() if not leads.empty else datetime.date.max)
+    last_day = max(sent['day'].max() if not sent.empty else datetime.date.min,
+                   leads['day'].max() if not leads.empty else datetime.date.min)
+    in_range = [company_day.c.day.between(first_day, last_day)]
+    days = {
+        row.day: {'day': row.day, 'sent': row.sent, 'leads': row.leads, 'lead_threshold': row.lead_threshold,
+                  'company_hll': _registers(row.company_hll), 'recipient_hll': _registers(row.recipient_hll)}
+        for row in conn.execute(select(company_day).where(*in_range))
+    }
+    empty = np.zeros(HLL_REGISTERS, dtype='uint8')
+    for day in set(sent['day']) | set(leads['day']):
+        days.setdefault(day, {'day': day, 'sent': 0, 'leads': 0, 'lead_threshold': 0,
+                              'company_hll': empty, 'recipient_hll': empty})
+
+    for column, hll in (('company_name', 'company_hll'), ('recipient_email', 'recipient_hll')):
+        present = sent[sent[column].notna()]
+        index, rank = hll_hashes(present[column])
+        for day, positions in present.reset_index(drop=True).groupby('day').indices.items():
+            days[day][hll] = np.maximum(days[day][hll], hll_registers(index[positions], rank[positions]))
+    for day, count in sent.groupby('day').size().items():
+        days[day]['sent'] += int(count)
+    for day, count in leads.groupby('day').size().items():
+        days[day]['leads'] += int(count)
+
+    # Add the new counts to the listed companies; newcomers start with the
+    # day's threshold as their error. Keep the `capacity` highest count +
+    # error per day and raise the threshold to the highest one dropped.
+    existing = pd.read_sql(
+        select(company_top.c.day, company_top.c.company_name, company_top.c['count'], company_top.c.error)
+        .where(company_top.c.day.between(first_day, last_day)),
+        conn,
+    )
+    existing['day'] = pd.to_datetime(existing['day']).dt.date
+    new = leads.groupby(['day', 'company_name']).size().rename('new')
+    top = existing.set_index(['day', 'company_name']).join(new, how='outer').reset_index()
+    thresholds = top['day'].map({day: row['lead_threshold'] for day, row in days.items()})
+    top['error'] = top['error'].fillna(thresholds)
+    top['count'] = top['count'].fillna(0) + top['new'].fillna(0)
+    top = top.astype({'count': 'int64', 'error': 'int64'})
+    top['upper'] = top['count'] + top['error']
+    top = top.sort_values(['day', 'upper', 'count', 'company_name'], ascending=[True, False, False, True],
+                          kind='stable')
+    rank = top.groupby('day').cumcount()
+    for day, dropped in top[rank >= capacity].groupby('day')['upper'].max().items():
+        days[day]['lead_threshold'] = max(days[day]['lead_threshold'], int(dropped))
+    top = top.loc[rank < capacity, ['day', 'company_name', 'count', 'error']]
+
+    conn.execute(delete(company_day).where(*in_range))
+    conn.execute(delete(company_top).where(company_top.c.day.between(first_day, last_day)))
+    conn.execute(company_day.insert(), [
+        {**row, 'company_hll': row['company_hll'].tobytes(), 'recipient_hll': row['recipient_hll'].tobytes()}
+        for row in days.values()
+    ])
+    if not top.empty:
+        conn.execute(company_top.insert(), top.astype(object).to_dict('records'))
+    return len(sent) + len(leads)
+
+
+def update_reply_time_sketches(engine):
+    """Fold new replies into the reply-time sketches. Returns the number of replies folded in."""
+    return _fold_new_emails(engine, 'reply_time', [reply_sketch], _fold_reply_times)
+
+
+def update_company_sketches(engine, capacity=TOP_CAPACITY):
+    """Fold new sent emails and positive replies into the company sketches, keeping `capacity` companies a day."""
+    return _fold_new_emails(engine, 'company', [company_day, company_top], partial(_fold_companies, capacity=capacity))
+
+
+def update_sketches(engine, capacity=TOP_CAPACITY):
+    """Update every sketch family; returns {family: rows folded in}."""
+    return {'reply_time': update_reply_time_sketches(engine), 'company': update_company_sketches(engine, capacity)}
+
+
+def rebuild_sketches(engine):
+    """Drop all sketch rows and rebuild from the full emails table."""
+    tables = [reply_sketch, company_day, company_top, watermark]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(delete(table))
+    return update_sketches(engine)
+
+
+# --- WINDOW QUERIES ---
+
+def _days(table, start_dt, end_dt):
+    return table.c.day.between(start_dt.date(), end_dt.date())
+
+
+def query_merged_sketches(conn, start_dt, end_dt, dimension='all'):
+    """Daily sketches of the window merged per dimension value: value, bucket, count."""
+    stmt = (
+        select(reply_sketch.c.value, reply_sketch.c.bucket, func.sum(reply_sketch.c['count']).label('count'))
+        .where(reply_sketch.c.dimension == dimension, _days(reply_sketch, start_dt, end_dt))
+        .group_by(reply_sketch.c.value, reply_sketch.c.bucket)
+    )
+    return pd.read_sql(stmt, conn)
+
+
+def reply_time_quantile_frame(merged, dimension, quantiles=DEFAULT_QUANTILES):
+    """One row per dimension value: Replies and the quantiles in hours (e.g. 'p90 (h)')."""
+    labels = [f"p{q * 100:g} (h)" for q in quantiles]
+    rows = []
+    for value, group in merged.groupby('value', sort=True):
+        estimates = sketch_quantiles(group['bucket'].to_numpy(), group['count'].to_numpy(), quantiles)
+        rows.append([value, int(group['count'].sum())] + [e / 3600 for e in estimates])
+    return pd.DataFrame(rows, columns=[dimension, 'Replies'] + labels)
+
+
+def query_reply_time_quantiles(conn, start_dt, end_dt, dimension='all', quantiles=DEFAULT_QUANTILES):
+    return reply_time_quantile_frame(query_merged_sketches(conn, start_dt, end_dt, dimension), dimension, quantiles)
+
+
+def load_reply_time_quantiles(engine, start_dt, end_dt, dimension='all', quantiles=DEFAULT_QUANTILES):
+    """Fold new replies into the sketches, then answer the window from them."""
+    update_reply_time_sketches(engine)
+    with engine.connect() as conn:
+        return query_reply_time_quantiles(conn, start_dt, end_dt, dimension, quantiles)
+
+
+def _window_totals(conn, start_dt, end_dt):
+    return conn.execute(
+        select(func.coalesce(func.sum(company_day.c.sent), 0), func.coalesce(func.sum(company_day.c.leads), 0),
+               func.coalesce(func.sum(company_day.c.lead_threshold), 0))
+        .where(_days(company_day, start_dt, end_dt))
+    ).one()
+
+
+def query_top_companies(conn, start_dt, end_dt, limit=10, exact_max_rows=EXACT_MAX_ROWS):
+    """
+    (top companies frame, error bound): exact from the emails table when the
+    window has at most exact_max_rows positive replies (bound 0), otherwise
+    from the merged daily top lists, whose counts may fall short by the bound.
+    """
+    _, leads, bound = _window_totals(conn, start_dt, end_dt)
+    if leads <= exact_max_rows:
+        return queries.query_top_companies(conn, start_dt, end_dt, limit=limit), 0
+    count = func.sum(company_top.c['count']).label('count')
+    stmt = (
+        select(company_top.c.company_name, count)
+        .where(_days(company_top, start_dt, end_dt))
+        .group_by(company_top.c.company_name)
+        .order_by(count.desc(), company_top.c.company_name)
+        .limit(limit)
+    )
+    return metrics.top_companies_frame(pd.read_sql(stmt, conn), limit=limit), int(bound)
+
+
+def query_distinct_counts(conn, start_dt, end_dt, exact_max_rows=EXACT_MAX_ROWS):
+    """
+    Distinct companies and recipients of the window's sent emails:
+    {'companies', 'recipients', 'exact'}. Exact for at most exact_max_rows
+    sent emails, otherwise HyperLogLog estimates.
+    """
+    sent, _, _ = _window_totals(conn, start_dt, end_dt)
+    if sent <= exact_max_rows:
+        companies, recipients = conn.execute(
+            select(func.count(func.distinct(emails.c.company_name)), func.count(func.distinct(emails.c.recipient_email)))
+            .where(queries.in_window(start_dt, end_dt), queries.IS_SENT)
+        ).one()
+        return {'companies': companies, 'recipients': recipients, 'exact': True}
+    company_registers = np.zeros(HLL_REGISTERS, dtype='uint8')
+    recipient_registers = np.zeros(HLL_REGISTERS, dtype='uint8')
+    for row in conn.execute(select(company_day.c.company_hll, company_day.c.recipient_hll)
+                            .where(_days(company_day, start_dt, end_dt))):
+        company_registers = np.maximum(company_registers, _registers(row.company_hll))
+        recipient_registers = np.maximum(recipient_registers, _registers(row.recipient_hll))
+    return {'companies': round(hll_estimate(company_registers)),
+            'recipients': round(hll_estimate(recipient_registers)), 'exact': False}
+
+
+def load_company_sketch_panels(engine, start_dt, end_dt, limit=10):
+    """Fold new emails into the company sketches, then answer the window from them."""
+    update_company_sketches(engine)
+    with engine.connect() as conn:
+        top, bound = query_top_companies(conn, start_dt, end_dt, limit=limit)
+        return top, bound, query_distinct_counts(conn, start_dt, end_dt)
+
+
+# --- ACCURACY CHECK ---
+
+def _check_reply_times(conn, raw, start_dt, end_dt, days, quantiles):
+    window = raw[(raw['day'] >= start_dt.date()) & (raw['day'] <= end_dt.date())]
+    ok, worst = True, 0.0
+    for dimension in ['all'] + SKETCH_DIMENSIONS:
+        estimated = query_reply_time_quantiles(conn, start_dt, end_dt, dimension, quantiles)
+        groups = {'': window} if dimension == 'all' else dict(list(window.groupby(dimension)))
+        for _, row in estimated.iterrows():
+            values = groups[row[dimension]]['reply_time_delta_seconds'].to_numpy()
+            exact = np.quantile(values, quantiles, method='lower')
+            approx = row.iloc[2:].to_numpy(dtype='float64') * 3600
+            error = np.abs(approx - exact) / np.maximum(exact, 1)
+            worst = max(worst, float(error.max()))
+            if row['Replies'] != len(values) or (error > RELATIVE_ACCURACY + 1e-9).any():
+                ok = False
+                print(f"  {days}d {dimension}={row[dimension]!r}: exact {exact}, sketch {approx}")
+    return ok, worst
+
+
+def _check_companies(conn, start_dt, end_dt, days, limit=10):
+    ok = True
+    exact_counts = queries.query_top_companies(conn, start_dt, end_dt, limit=10**9)
+    exact_counts = dict(zip(exact_counts['company_name'], exact_counts['Positive Replies']))
+    top, bound = query_top_companies(conn, start_dt, end_dt, limit=limit, exact_max_rows=0)
+    for company, estimate in zip(top['company_name'], top['Positive Replies']):
+        if not exact_counts[company] - bound <= estimate <= exact_counts[company]:
+            ok = False
+            print(f"  {days}d {company!r}: {estimate} positive replies, exact {exact_counts[company]} (bound {bound})")
+    if len(top) == limit:
+        # Nothing left out may beat the last reported company by more than the bound
+        missed = [c for c, n in exact_counts.items() if n > top['Positive Replies'].iloc[-1] + bound
+                  and c not in set(top['company_name'])]
+        if missed:
+            ok = False
+            print(f"  {days}d top companies missed {missed[:5]}")
+
+    exact = query_distinct_counts(conn, start_dt, end_dt, exact_max_rows=float('inf'))
+    estimate = query_distinct_counts(conn, start_dt, end_dt, exact_max_rows=-1)
+    errors = []
+    for key in ('companies', 'recipients'):
+        error = abs(estimate[key] - exact[key]) / max(exact[key], 1)
+        errors.append(error)
+        # 4 standard errors
+        if error > 4 * 1.04 / math.sqrt(HLL_REGISTERS):
+            ok = False
+            print(f"  {days}d distinct {key}: exact {exact[key]}, estimate {estimate[key]}")
+    print(f"  {days:>3}d: top-{limit} count bound {bound}, distinct companies/recipients error "
+          f"{errors[0]:.2%}/{errors[1]:.2%}")
+    return ok
+
+
+def _check_refolds():
+    # One day folded four times with a one-company list: A is dropped in
+    # several folds and must still come out within the bound (exact 6)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'refold_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        noon = datetime.datetime.combine(datetime.date.today(), datetime.time(12))
+        for companies in (['B', 'B', 'A'], ['A'], ['A'], ['A', 'A', 'A']):
+            with engine.begin() as conn:
+                conn.execute(emails.insert(), [
+                    {'timestamp': noon, 'direction': 'received', 'is_reply': True, 'reply_sentiment': 'positive',
+                     'company_name': company} for company in companies
+                ])
+            update_company_sketches(engine, capacity=1)
+        with engine.connect() as conn:
+            ok = _check_companies(conn, noon.replace(hour=0), noon.replace(hour=23, minute=59), 1, limit=1)
+        engine.dispose()
+    return ok
+
+
+def check_accuracy(num_rows=200_000, seed=42, quantiles=DEFAULT_QUANTILES, capacity=50, batches=4):
+    """
+    Generate mock data into a throwaway SQLite database in `batches`
+    batches over the same days, so every day is folded several times,
+    update the sketches after each one, and compare every window against
+    exact answers from the raw emails: reply-time quantiles against numpy
+    for every dimension value, top companies against their exact counts and
+    distinct counts against COUNT(DISTINCT). The small default capacity
+    makes the daily top lists drop companies even on small datasets.
+    """
+    worst = 0.0
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'sketch_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        for batch_seed in range(seed, seed + batches):
+            generate_mock_data_fast(engine, num_rows=num_rows // batches, seed=batch_seed)
+            print(f"Folded {update_sketches(engine, capacity)} new rows into the sketches.")
+        with engine.connect() as conn:
+            raw = _reply_rows(conn)
+            today = datetime.date.today()
+            for days in (1, 7, 30, 90):
+                start_dt = datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time.min)
+                end_dt = datetime.datetime.combine(today, datetime.time.max)
+                window_ok, window_worst = _check_reply_times(conn, raw, start_dt, end_dt, days, quantiles)
+                ok = _check_companies(conn, start_dt, end_dt, days) and window_ok and ok
+                worst = max(worst, window_worst)
+        engine.dispose()
+    print("One day folded four times:")
+    ok = _check_refolds() and ok
+    print(f"Worst reply-time quantile error {worst:.4%} (bound {RELATIVE_ACCURACY:.0%}).")
+    print("All sketches within their bounds." if ok else "Sketch check FAILED.")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily reply-time and company sketches.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the sketches from scratch")
+    parser.add_argument("--check", action="store_true",
+                        help="check the error bounds against exact answers on a generated SQLite dataset")
+    parser.add_argument("--rows", type=int, default=200_000, help="mock rows for --check")
+    parser.add_argument("--capacity", type=int, default=50, help="companies kept per day for --check")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check_accuracy(args.rows, capacity=args.capacity) else 1)
+
+    engine = partitions.install(create_engine(DB_URL))
+    folded = rebuild_sketches(engine) if args.rebuild else update_sketches(engine)
+    print(f"Folded {folded} rows into the sketches.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, select, func
+
+import id_watermarks
+import partitions
+from mock_db import Email, DB_URL, existing_columns
+
+# --- DAY-PARTITIONED PARQUET SNAPSHOT OF THE EMAILS TABLE ---
+# Layout: <root>/day=YYYY-MM-DD/part.parquet plus <root>/_manifest.json,
+# which records the highest emails.id exported so far and the ids below it
+# that were not committed yet (gap_ids, see id_watermarks.py).
+
+DEFAULT_SNAPSHOT_DIR = "snapshots/emails"
+MANIFEST = "_manifest.json"  # leading underscore: ignored by pyarrow datasets
+
+emails = Email.__table__
+
+ARROW_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('timestamp', pa.timestamp('us')),
+    ('direction', pa.string()),
+    ('is_reply', pa.bool_()),
+    ('sender_email', pa.string()),
+    ('recipient_email', pa.string()),
+    ('company_name', pa.string()),
+    ('company_size', pa.string()),
+    ('company_industry', pa.string()),
+    ('contact_title', pa.string()),
+    ('reply_sentiment', pa.string()),
+    ('ai_agent', pa.string()),
+    ('city', pa.string()),
+    ('reply_time_delta_seconds', pa.int32()),
+    ('reply_to_id', pa.int64()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+
+
+def _read_manifest(root):
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {'last_email_id': 0, 'gap_ids': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _write_day(conn, root, day):
+    start_dt = datetime.datetime.combine(day, datetime.time.min)
+    stmt = (
+        select(*existing_columns(conn))
+        .where(emails.c.timestamp >= start_dt, emails.c.timestamp < start_dt + datetime.timedelta(days=1))
+        .order_by(emails.c.id)
+    )
+    # An unmigrated table has no reply_to_id; the snapshot holds it as nulls
+    df = pd.read_sql(stmt, conn).reindex(columns=ARROW_SCHEMA.names)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['is_reply'] = df['is_reply'].astype('boolean')
+    df['reply_time_delta_seconds'] = df['reply_time_delta_seconds'].astype('Int32')
+    df['reply_to_id'] = df['reply_to_id'].astype('Int64')
+    table = pa.Table.from_pandas(df, schema=ARROW_SCHEMA, preserve_index=False)
+
+    partition = os.path.join(root, f"day={day.isoformat()}")
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, "part.parquet")
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+    return len(df)
+
+
+def export_snapshot(engine, root=DEFAULT_SNAPSHOT_DIR, full=False):
+    """
+    Write every day that received rows since the last export (by emails.id)
+    as its own Parquet partition, replacing the old file for that day.
+    full=True rewrites the whole snapshot. Rows deleted or updated in
+    place are only picked up by a full export.
+    """
+    if full and os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root, exist_ok=True)
+    manifest = _read_manifest(root)
+    with engine.connect() as conn:
+        max_id = conn.execute(select(func.coalesce(func.max(emails.c.id), 0))).scalar()
+        if max_id < manifest['last_email_id']:
+            print("emails table shrank since the last export; run with --full.")
+            return []
+        day = func.date(emails.c.timestamp)
+        # Days of new rows and of late commits below the last export's max id
+        gap_ids = manifest.get('gap_ids', [])
+        changed = conn.execute(
+            select(day)
+            .where(id_watermarks.new_rows(manifest['last_email_id'], max_id, gap_ids))
+            .distinct()
+        ).scalars().all()
+        changed = sorted(pd.to_datetime(pd.Series(changed)).dt.date) if changed else []
+        for changed_day in changed:
+            rows = _write_day(conn, root, changed_day)
+            print(f"  day={changed_day.isoformat()}: {rows} rows")
+        manifest['gap_ids'] = id_watermarks.missing_ids(conn, max_id)
+    manifest['last_email_id'] = int(max_id)
+    manifest['exported_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+    _write_manifest(root, manifest)
+    print(f"Refreshed {len(changed)} partition(s); snapshot is at emails.id {max_id}.")
+    return changed
+
+
+# --- READ BACKEND ---
+
+def load_window(root, start_dt, end_dt, columns=None):
+    """
+    Read the window from the snapshot. Only partitions whose day overlaps
+    the window are opened (memory-mapped), only `columns` are read, and the
+    timestamp predicate is pushed down to the Parquet row groups.
+    """
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or ARROW_SCHEMA.names)
+    dataset = ds.dataset(
+        root, format='parquet', partitioning=PARTITIONING,
+        filesystem=pafs.LocalFileSystem(use_mmap=True), schema=ARROW_SCHEMA.append(pa.field('day', pa.string())),
+    )
+    predicate = (
+        (ds.field('day') >= start_dt.date().isoformat())
+        & (ds.field('day') <= end_dt.date().isoformat())
+        & (ds.field('timestamp') >= pa.scalar(start_dt, type=pa.timestamp('us')))
+        & (ds.field('timestamp') <= pa.scalar(end_dt, type=pa.timestamp('us')))
+    )
+    table = dataset.to_table(columns=columns or ARROW_SCHEMA.names, filter=predicate)
+    df = table.to_pandas()
+    df['timestamp'] = df['timestamp'].astype('datetime64[ns]')
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the emails table to a day-partitioned Parquet snapshot.")
+    parser.add_argument("--root", default=os.environ.get("DASHBOARD_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR))
+    parser.add_argument("--full", action="store_true", help="rewrite the whole snapshot")
+    args = parser.parse_args()
+    export_snapshot(partitions.install(create_engine(DB_URL)), args.root, full=args.full)
+
+
+if __name__ == "__main__":
+    main()
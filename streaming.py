@@ -0,0 +1,135 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import tracemalloc
+
+import pandas as pd
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import metrics
+import queries
+from frame_schema import PROJECTED_COLUMNS
+from mock_db import Base, Email, generate_mock_data
+
+emails = Email.__table__
+
+DEFAULT_CHUNKSIZE = 50000
+
+
+class PanelAccumulator:
+    """
+    Running aggregates for every dashboard panel. Feed it raw email frames
+    of any size with update(); panels() returns the same frames as the
+    in-memory path. Memory is bounded by the number of distinct group keys
+    (days, dimension values, reply days, positively replying companies),
+    not by the number of rows. window (start_dt, end_dt) picks the Emails
+    Over Time resolution, as for the SQL panels of that window.
+    """
+
+    def __init__(self, window=None):
+        self.aggregates = None
+        self.window = window
+
+    def update(self, chunk):
+        if not chunk.empty:
+            self.aggregates = metrics.merge(self.aggregates, metrics.aggregate(chunk))
+        return self
+
+    def panels(self):
+        if self.aggregates is None:
+            return metrics.compute_panels(pd.DataFrame(columns=PROJECTED_COLUMNS), window=self.window)
+        return metrics.finish(self.aggregates, window=self.window)
+
+
+def iter_window_chunks(conn, start_dt, end_dt, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield the window's rows (projected columns only) in frames of at most chunksize rows."""
+    stmt = (
+        select(*[emails.c[c] for c in PROJECTED_COLUMNS])
+        .where(emails.c.timestamp.between(start_dt, end_dt))
+    )
+    # Server-side cursor, so the driver does not buffer the whole result either
+    conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+    yield from pd.read_sql(stmt, conn, chunksize=chunksize)
+
+
+def stream_panels(engine, start_dt, end_dt, chunksize=DEFAULT_CHUNKSIZE):
+    accumulator = PanelAccumulator(window=(start_dt, end_dt))
+    with engine.connect() as conn:
+        for chunk in iter_window_chunks(conn, start_dt, end_dt, chunksize=chunksize):
+            accumulator.update(chunk)
+    return accumulator.panels()
+
+
+# --- VERIFICATION ---
+
+def _mismatches(left, right):
+    bad = []
+    for name in left:
+        try:
+            pd.testing.assert_frame_equal(left[name].reset_index(drop=True), right[name].reset_index(drop=True),
+                                          check_dtype=False)
+        except AssertionError as e:
+            print(f"[{name}] differs:\n{e}")
+            bad.append(name)
+    return bad
+
+
+def verify(num_entries=20000, chunksize=1000, seed=7):
+    """
+    Generate a SQLite dataset several times larger than chunksize and check
+    that the streamed panels equal the in-memory ones for a few windows.
+    Also prints the traced peak memory of both paths.
+    """
+    random.seed(seed)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'stream_check.db')}")
+        Base.metadata.create_all(bind=engine, tables=[emails])
+        session = sessionmaker(bind=engine)()
+        try:
+            generate_mock_data(session, num_entries)
+        finally:
+            session.close()
+        today = datetime.date.today()
+        for days in (7, 30, 120):
+            start_dt = datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time.min)
+            end_dt = datetime.datetime.combine(today, datetime.time.max)
+
+            tracemalloc.start()
+            streamed = stream_panels(engine, start_dt, end_dt, chunksize=chunksize)
+            stream_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            with engine.connect() as conn:
+                frame = pd.read_sql(
+                    select(*[emails.c[c] for c in PROJECTED_COLUMNS])
+                    .where(emails.c.timestamp.between(start_dt, end_dt)), conn)
+            in_memory = PanelAccumulator(window=(start_dt, end_dt)).update(frame).panels()
+            memory_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            from_sql = queries.load_panels(engine, start_dt, end_dt)
+            rows = int(streamed['metrics']['total_emails'].iloc[0])
+            bad = _mismatches(streamed, in_memory) + _mismatches(streamed, from_sql)
+            ok = ok and not bad
+            print(f"{days:>4} days: {rows} rows in {-(-rows // chunksize)} chunks, "
+                  f"peak {stream_peak / 2**20:.1f} MiB streamed vs {memory_peak / 2**20:.1f} MiB in memory, "
+                  f"{'OK' if not bad else 'MISMATCH ' + ', '.join(sorted(set(bad)))}")
+        engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the chunked streaming aggregation.")
+    parser.add_argument("--entries", type=int, default=20000, help="mock entries to generate")
+    parser.add_argument("--chunksize", type=int, default=1000)
+    args = parser.parse_args()
+    raise SystemExit(0 if verify(args.entries, args.chunksize) else 1)
+
+
+if __name__ == "__main__":
+    main()